@@ -1,32 +1,55 @@
 # importing modules
-import pandas as pd
+import os
+import sys
+import numpy as np
 import tkinter as tk
 from tkinter import ttk
+from matplotlib import colormaps
+from matplotlib.collections import LineCollection
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import matplotlib.ticker as ticker
 from matplotlib.backend_tools import Cursors
 
-# preparing and formatting the data we'll need
-names = pd.read_csv("../dpt2020.csv", sep=";")
-names.drop(names[names.preusuel == '_PRENOMS_RARES'].index, inplace=True)
-names.drop(names[names.dpt == 'XX'].index, inplace=True)
-grouped = names.groupby(['preusuel', 'annais']).agg({'nombre': 'sum'}).reset_index()
-unique_names=grouped['preusuel'].unique()
-
-# np.unique but with lists
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from babynames.cube import NameCube
+from babynames.curves import CurveIndex
+from babynames.search import NameSearchIndex
+from babynames.similar import SimilarityIndex
+
+# preparing and formatting the data we'll need: the distinct names (sorted) and the
+# births of every name for every year come from the cube, plotting a name is a row lookup
+cube = NameCube.load()
+unique_names = cube.names
+search_index = NameSearchIndex(unique_names)
+births_per_year = cube.name_year_matrix()
+# national totals computed once, the names from the most to the least given
+popularity_order = np.argsort(-births_per_year.sum(axis=1, dtype=np.int64), kind='stable')
+# names with the same popularity curve or the same sound as a selected one
+similarity = SimilarityIndex.load(cube)
+SIMILAR_NAMES = 5
+
+# the listbox only shows the first matches; a keystroke is searched at once, the ones
+# following it within a frame are coalesced into one search at the end of the frame
+MAX_LISTED_NAMES = 500
+SEARCH_DELAY_MS = 16
+
+# above MANY_NAMES selected names, all the curves are one LineCollection without legend and the
+# hovered curve is found with a CurveIndex and drawn over a saved background (blitting)
+MANY_NAMES = 30
+MAX_TOP_NAMES = 500
+HOVER_PIXELS = 4
+
+# np.unique but with lists, keeping the order
 def unique(l):
-    unique_list = []
-    for x in l:
-        if x not in unique_list:
-            unique_list.append(x)
-    return unique_list
+    return list(dict.fromkeys(l))
 
 # creating empty plot
 def create_initial_plot():
     fig = Figure(figsize=(10, 6), dpi=100)
     ax = fig.add_subplot(111)
     ax.set_title("Initial Plot")
+    ax.xaxis.set_major_locator(ticker.MultipleLocator(10))
     return fig
 
 # When a name is selected, we update selected_names
@@ -35,74 +58,148 @@ def select_name(event, selected_names):
     selected_names.append(selected_name)
     update_plot(selected_names)
 
-# Updating the figure with the new selected_names list
+# Updating the figure with the new selected_names list: only the lines of the
+# names added or removed since the last call are touched
 def update_plot(selected_names):
-    fig.clear()
-    ax = fig.add_subplot(111)
+    global curve_index
     selected_names=unique(selected_names)
+    many = len(selected_names) > MANY_NAMES
+    kept = set() if many else set(selected_names)
+
+    for name in list(lines):
+        if name not in kept:
+            lines.pop(name).remove()
+
+    if many:
+        values = births_per_year[[cube.name_code(name) for name in selected_names]]
+        segments = np.empty(values.shape + (2,))
+        segments[:, :, 0] = cube.years
+        segments[:, :, 1] = values
+        collection.set_segments(segments)
+        collection.set_color(colormaps['tab20'](np.arange(len(values)) % 20))
+        curve_names[:] = selected_names
+        curve_index = CurveIndex(cube.years, values)
+    else:
+        collection.set_segments([])
+        curve_names.clear()
+        curve_index = None
+        for name in selected_names:
+            if name not in lines:
+                line, = ax.plot(cube.years, births_per_year[cube.name_code(name)], label=name, picker=5)
+                lines[name] = line
+
+    if lines:
+        ax.set_title("Name popularity as a function of time")
+        ax.legend()  # Add legend to differentiate curves
+    else:
+        ax.set_title(f"Name popularity as a function of time ({len(curve_names)} names)" if many else "Initial Plot")
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
+    ax.relim()
+    if many:
+        # relim only looks at lines, the collection has to be added to the data limits
+        ax.update_datalim([(cube.years[0], 0), (cube.years[-1], values.max())])
+    ax.autoscale_view()
+    canvas.draw_idle()
+
+# the curve under the pointer in many names mode, None if there is none
+def curve_under(event):
+    if curve_index is None or event.inaxes is not ax or event.xdata is None:
+        return None
+    # HOVER_PIXELS in data units
+    (_, bottom), (_, top) = ax.transData.inverted().transform([(0, 0), (0, HOVER_PIXELS)])
+    return curve_index.nearest(event.xdata, event.ydata, abs(top - bottom))
+
+# remove one name when clicking on line
+def onpick(event):
+    global selected_names
+    if event.artist in lines.values():
+        removed = event.artist.get_label()
+    elif event.artist is collection and curve_names:
+        index = curve_under(event.mouseevent)
+        removed = curve_names[event.ind[0] if index is None else index]
+    else:
+        return
+    selected_names = [name for name in selected_names if name != removed]
+    update_plot(selected_names)
 
-    lines = []
-    for name in selected_names:
-        data = grouped[grouped['preusuel'] == name]
-        x = list(data["annais"])        
-        y = list(data["nombre"])
-
-        # we make sure to have values for all years
-        for year in range(1900,2020):
-            if str(year) not in x:
-                x.append(year)
-                y.append(0)
-
-        sorted_lists = sorted(zip(map(int, x), y)) # we sort the lists according to the year
-        x,y=zip(*sorted_lists)
-
-        line, = ax.plot(x, y, label=name, picker=5)
-        lines.append(line)
-
-    ax.xaxis.set_major_locator(ticker.MultipleLocator(10))
-    ax.set_title("Name popularity as a function of time")
-    ax.legend()  # Add legend to differentiate curves
-    canvas.draw()
-
-    # remove one name when clicking on line
-    def onpick(event):
-        if event.artist in lines:
-            lines.remove(event.artist)
-            global selected_names
-            selected_names.remove(event.artist.get_label())
-            event.artist.remove()
-            update_plot(selected_names)
-    
-    fig.canvas.mpl_connect('pick_event', onpick)
-
-    # special pointer when hovering line
-    def on_hover(event):
-        if event.inaxes:
-            for line in lines:
-                cont, ind = line.contains(event)
-                if cont:
-                    fig.canvas.set_cursor(Cursors.HAND)
-                    return
-        fig.canvas.set_cursor(Cursors.POINTER)
-
-
-    fig.canvas.mpl_connect('motion_notify_event', on_hover)
+# the figure without the hover highlight, saved after every full draw
+def on_draw(event):
+    global hover_background
+    hover_background = canvas.copy_from_bbox(fig.bbox)
+
+# in many names mode the hovered curve is highlighted and named: only the highlight is drawn
+# over the saved background instead of redrawing every curve
+def show_hovered(event, index):
+    global hovered
+    if index is None and hovered is None:
+        return
+    hovered = index
+    if hover_background is None:
+        return
+    canvas.restore_region(hover_background)
+    if index is not None:
+        highlight.set_data(cube.years, curve_index.values[index])
+        hover_label.xy = (event.xdata, event.ydata)
+        hover_label.set_text(curve_names[index])
+        ax.draw_artist(highlight)
+        ax.draw_artist(hover_label)
+    canvas.blit(fig.bbox)
+
+# special pointer when hovering line
+def on_hover(event):
+    if curve_index is not None:
+        index = curve_under(event)
+        show_hovered(event, index)
+        fig.canvas.set_cursor(Cursors.POINTER if index is None else Cursors.HAND)
+        return
+    if event.inaxes:
+        for line in lines.values():
+            cont, ind = line.contains(event)
+            if cont:
+                fig.canvas.set_cursor(Cursors.HAND)
+                return
+    fig.canvas.set_cursor(Cursors.POINTER)
 
 # Resetting the names selected
 def reset_plot():
     global selected_names
-    fig.clear()
     selected_names=[]
-    canvas.draw()
+    update_plot(selected_names)
 
-# Based on search query, we 
-def update_listbox(event):
-    searched = search_entry.get().upper()
+# Based on search query, we fill the listbox with the matching names
+def fill_listbox(matches):
     name_listbox.delete(0, tk.END)
+    name_listbox.insert(tk.END, *matches[:MAX_LISTED_NAMES])
+    if len(matches) > MAX_LISTED_NAMES:
+        label.config(text=f"Select a Name: ({len(matches)} matches, first {MAX_LISTED_NAMES} shown)")
+    else:
+        label.config(text=f"Select a Name: ({len(matches)} matches)")
+
+def run_search():
+    global last_searched
+    searched = search_entry.get()
+    if searched == last_searched:
+        return
+    last_searched = searched
+    fill_listbox(search_index.search(searched))
+
+def end_coalescing():
+    global coalescing
+    coalescing = None
+    # the keystrokes of the frame changed the text: search it, and coalesce the next frame
+    if search_entry.get() != last_searched:
+        update_listbox(None)
+
+# the first keystroke is searched without waiting, the next ones until SEARCH_DELAY_MS only trigger one search
+def update_listbox(event):
+    global coalescing
+    if coalescing is None:
+        run_search()
+        coalescing = root.after(SEARCH_DELAY_MS, end_coalescing)
 
-    for name in unique_names:
-        if searched in name:
-            name_listbox.insert(tk.END, name)
+coalescing = None
+last_searched = ''
 
 root = tk.Tk()
 root.title("Matplotlib Plot in Tkinter")
@@ -113,11 +210,26 @@ selected_names = []
 plot_frame = ttk.Frame(root)
 plot_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=1)
 
-# canvas for plotting
+# canvas for plotting, the handlers are connected once for the whole session
 fig = create_initial_plot()
+ax = fig.axes[0]
+lines = {}
+# many names mode: one collection for all the curves, the names of its segments and their index
+collection = LineCollection([], linewidths=1, picker=HOVER_PIXELS)
+ax.add_collection(collection)
+curve_names = []
+curve_index = None
+# drawn by show_hovered only
+highlight, = ax.plot([], [], color='black', linewidth=2.5, animated=True)
+hover_label = ax.annotate('', xy=(0, 0), xytext=(8, 8), textcoords='offset points', animated=True)
+hover_background = None
+hovered = None
 canvas = FigureCanvasTkAgg(fig, master=plot_frame)
+fig.canvas.mpl_connect('draw_event', on_draw)
 canvas.draw()
 canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
+fig.canvas.mpl_connect('pick_event', onpick)
+fig.canvas.mpl_connect('motion_notify_event', on_hover)
 
 # "Button" frame on the right
 button_frame = ttk.Frame(root, width=400)
@@ -135,8 +247,7 @@ search_entry.pack(pady=10, padx=10, fill=tk.X)
 scrollbar = ttk.Scrollbar(button_frame, orient=tk.VERTICAL)
 name_listbox = tk.Listbox(button_frame, yscrollcommand=scrollbar.set, height=5)
 
-for name in unique_names:
-    name_listbox.insert(tk.END, name)
+fill_listbox(search_index.search(''))
 
 scrollbar.config(command=name_listbox.yview)
 scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
@@ -151,14 +262,12 @@ reset_button = ttk.Button(button_frame, text="Reset", command=reset_plot)
 reset_button.pack(pady=30, padx=20)
 
 # Most popular names button
-def find_most_popular_names():
-    total_counts = grouped.groupby('preusuel')['nombre'].sum()
-    most_popular = total_counts.nlargest(3).index.tolist()
-    return most_popular
+def find_most_popular_names(num_names=3):
+    return cube.names[popularity_order[:num_names]].tolist()
 
-def add_most_popular():
+def add_most_popular(num_names=3):
     global selected_names
-    most_popular_names = find_most_popular_names()
+    most_popular_names = find_most_popular_names(num_names)
     selected_names.extend(most_popular_names)
     selected_names=unique(selected_names)
     update_plot(selected_names)
@@ -166,4 +275,37 @@ def add_most_popular():
 most_popular_button = ttk.Button(button_frame, text="3 Most Popular", command=add_most_popular)
 most_popular_button.pack(pady=10, padx=20)
 
+# Top N names, up to MAX_TOP_NAMES curves
+def add_top_names():
+    try:
+        num_names = int(top_names_spinbox.get())
+    except ValueError:
+        return
+    add_most_popular(max(1, min(num_names, MAX_TOP_NAMES)))
+
+top_names_frame = ttk.Frame(button_frame)
+top_names_frame.pack(pady=10, padx=20)
+top_names_spinbox = ttk.Spinbox(top_names_frame, from_=1, to=MAX_TOP_NAMES, width=5)
+top_names_spinbox.set(100)
+top_names_spinbox.pack(side=tk.LEFT)
+top_names_button = ttk.Button(top_names_frame, text="Most Popular", command=add_top_names)
+top_names_button.pack(side=tk.LEFT, padx=5)
+
+# Names like the last selected one: same popularity curve, or same sound (CAMILLE / KAMILLE)
+def add_names_like_last(find):
+    global selected_names
+    if not selected_names:
+        return
+    selected_names.extend(find(selected_names[-1]))
+    selected_names=unique(selected_names)
+    update_plot(selected_names)
+
+similar_button = ttk.Button(button_frame, text=f"{SIMILAR_NAMES} Similar Curves",
+                            command=lambda: add_names_like_last(lambda name: similarity.similar(name, SIMILAR_NAMES)[0]))
+similar_button.pack(pady=10, padx=20)
+
+variants_button = ttk.Button(button_frame, text="Spelling Variants",
+                             command=lambda: add_names_like_last(similarity.variants))
+variants_button.pack(pady=10, padx=20)
+
 root.mainloop()
\ No newline at end of file
@@ -0,0 +1,11 @@
+# Shared data layer for the three baby names visualisations
+import logging
+import os
+
+# BABYNAMES_LOG_LEVEL=DEBUG prints the debug messages of the package, e.g. the queries without births, on stderr
+LOG_LEVEL = os.environ.get('BABYNAMES_LOG_LEVEL')
+if LOG_LEVEL:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(name)s %(levelname)s: %(message)s'))
+    logging.getLogger(__name__).addHandler(_handler)
+    logging.getLogger(__name__).setLevel(LOG_LEVEL.upper())
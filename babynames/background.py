@@ -0,0 +1,83 @@
+# Runs the queries and chart builds of the panel callbacks off the event loop.
+#
+# The Tornado event loop is shared by every session of the server, so a
+# callback computing on it blocks all of them. The apps' callbacks are
+# coroutines that hand the work to a thread pool through a LatestRequest,
+# which also drops the requests made obsolete by newer input: a request of
+# typed input (run) waits DEBOUNCE_SECONDS before starting and is skipped if
+# a newer one came in meanwhile, the requests of toggles and selects
+# (run_now) start at once, and the result of a request is discarded if a
+# newer one started while it ran.
+#
+# Threads rather than processes: the charts put their datasets in the
+# process-local datastore and result cache, and most of the work is numpy
+# or json code that does not hold the GIL for long.
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from babynames import tracing
+
+DEBOUNCE_SECONDS = float(os.environ.get('BABYNAMES_DEBOUNCE_SECONDS', 0.25))
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('BABYNAMES_WORKERS', 4)),
+                              thread_name_prefix='babynames')
+
+# returned instead of a result when a newer request made it useless
+STALE = object()
+
+
+class LatestRequest:
+    """Runs the newest request of a session in the pool, showing indicator as loading meanwhile.
+
+    indicator is any panel object with a loading parameter, usually the
+    pane displaying the result.
+    """
+
+    def __init__(self, indicator=None, delay=DEBOUNCE_SECONDS, executor=None):
+        self.indicator = indicator
+        self.delay = delay
+        self.executor = executor or EXECUTOR
+        self._generation = 0
+        self._future = None
+
+    @staticmethod
+    def _timed(submitted, function, args, kwargs):
+        # time spent queued behind the work of other sessions
+        tracing.TRACER.add('pool.wait', time.perf_counter() - submitted)
+        return function(*args, **kwargs)
+
+    def _set_loading(self, loading):
+        if self.indicator is not None:
+            self.indicator.loading = loading
+
+    async def run(self, function, *args, **kwargs):
+        """function(*args, **kwargs) computed in the pool after the delay, or STALE if a newer request superseded it."""
+        return await self._run(self.delay, function, args, kwargs)
+
+    async def run_now(self, function, *args, **kwargs):
+        """Same as run without the delay, for input that does not come in bursts."""
+        return await self._run(0, function, args, kwargs)
+
+    async def _run(self, delay, function, args, kwargs):
+        self._generation += 1
+        generation = self._generation
+        self._set_loading(True)
+        try:
+            await asyncio.sleep(delay)
+            if generation != self._generation:
+                return STALE
+            if self._future is not None:
+                # still queued behind other sessions' work: it will never be shown
+                self._future.cancel()
+            self._future = future = self.executor.submit(self._timed, time.perf_counter(), function, args, kwargs)
+            try:
+                result = await asyncio.wrap_future(future)
+            except BaseException:
+                if future.cancelled() or generation != self._generation:
+                    return STALE
+                raise
+            return result if generation == self._generation else STALE
+        finally:
+            if generation == self._generation:
+                self._set_loading(False)
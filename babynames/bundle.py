@@ -0,0 +1,81 @@
+# Static bundle of pre-rendered chart specs and aggregate tables.
+#
+# python -m babynames.queries <folder> renders the charts of every name given
+# at least --min-total times into a folder that needs no Python to be served:
+#   index.json                      names, year ranges and levels, SHA-1 of the CSV
+#   index.html                      viewer of the specs (vega-embed)
+#   specs/<kind>/<part>/.../<key>.json   Vega-Lite specs, see spec_path
+#   tables/<kind>/<key>.json        aggregate tables, see table_path
+#   datastore/<sha256>.json         datasets referenced by the specs (babynames.datastore)
+#   geo/                            department TopoJSON referenced by the maps
+# The urls in the specs are relative to the folder, so index.html can sit at
+# its root on any static host.
+#
+# With BABYNAMES_BUNDLE_DIR pointing to a bundle built from the same CSV, the
+# panel apps read the specs found there instead of computing them, and the
+# datastore handlers serve the bundled datasets.
+import functools
+import json
+import os
+import urllib.parse
+
+from babynames.data import CSV_PATH, source_sha1
+
+BUNDLE_DIR = os.environ.get('BABYNAMES_BUNDLE_DIR')
+INDEX_FILE = 'index.json'
+VIEWER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'viewer.html')
+
+
+def file_name(key):
+    """File name of a key, e.g. a name: 'FRÉDÉRIQUE' -> 'FR%C3%89D%C3%89RIQUE.json'."""
+    return urllib.parse.quote(str(key), safe='') + '.json'
+
+
+def spec_path(bundle_dir, kind, *key):
+    """specs/<kind>/<key[0]>/.../<key[-1]>.json, e.g. spec_path(d, 'map', 'department', '1900-2020', 'MARIE')."""
+    return os.path.join(bundle_dir, 'specs', kind, *[str(part) for part in key[:-1]], file_name(key[-1]))
+
+
+def table_path(bundle_dir, kind, key):
+    return os.path.join(bundle_dir, 'tables', kind, file_name(key))
+
+
+def write_text(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written next to the target and renamed, a reader never sees half a file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+    return len(text.encode())
+
+
+def write_json(path, value):
+    return write_text(path, json.dumps(value, separators=(',', ':'), ensure_ascii=False))
+
+
+def read_index(bundle_dir):
+    try:
+        with open(os.path.join(bundle_dir, INDEX_FILE), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def matches(bundle_dir, csv_path=CSV_PATH):
+    """True if the bundle is complete (it has an index) and was built from the CSV at csv_path."""
+    index = read_index(bundle_dir)
+    return index is not None and index.get('sha1') == source_sha1(csv_path)
+
+
+def read_spec(kind, *key, bundle_dir=None, csv_path=CSV_PATH):
+    """Serialized spec of the bundle, None without a matching bundle or when it has no such spec."""
+    bundle_dir = bundle_dir or BUNDLE_DIR
+    if not bundle_dir or not matches(bundle_dir, csv_path):
+        return None
+    try:
+        with open(spec_path(bundle_dir, kind, *key), encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
@@ -0,0 +1,165 @@
+# Precomputed name x department x year x sex birth counts.
+#
+# Two structures are kept, both with cumulative sums along the year axis so
+# that any [year_min, year_max] total is a subtraction:
+#  - national: dense (names, years + 1, sexes) prefix sums over all departments
+#  - keys/cumulative: the sparse rows sorted by (name, dpt, sex, year) with a
+#    running total. A year range of one (name, dpt, sex) cell is a contiguous
+#    slice of the keys, found with searchsorted.
+import numpy as np
+
+from babynames.data import CSV_PATH, load_derived
+
+SEXES = [1, 2]
+
+
+def build_cube_arrays(columns):
+    names = columns['preusuel.values']
+    dpts = columns['dpt.values']
+    name_codes = columns['preusuel.codes'].astype(np.int64)
+    dpt_codes = columns['dpt.codes'].astype(np.int64)
+    annais = columns['annais']
+    counts = columns['nombre'].astype(np.int64)
+
+    first_year = int(annais.min())
+    n_years = int(annais.max()) - first_year + 1
+    year_index = annais.astype(np.int64) - first_year
+    sex_index = columns['sexe'].astype(np.int64) - 1
+
+    # national counts, shifted by one year so that the cumsum starts with a zero row
+    flat = (name_codes * (n_years + 1) + year_index + 1) * 2 + sex_index
+    national = np.bincount(flat, weights=counts, minlength=len(names) * (n_years + 1) * 2)
+    national = np.cumsum(national.reshape(len(names), n_years + 1, 2), axis=1)
+
+    keys = ((name_codes * len(dpts) + dpt_codes) * 2 + sex_index) * n_years + year_index
+    order = np.argsort(keys, kind='stable')
+    cumulative = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(counts[order], out=cumulative[1:])
+
+    return {
+        'names': names,
+        'dpts': dpts,
+        'years': np.arange(first_year, first_year + n_years, dtype=np.int16),
+        'national': national.astype(np.uint32),
+        'keys': keys[order],
+        'cumulative': cumulative,
+    }
+
+
+class NameCube:
+    """Birth counts queryable by name, department, year range and sex."""
+
+    def __init__(self, arrays):
+        self.names = arrays['names']
+        self.dpts = arrays['dpts']
+        self.years = arrays['years']
+        self.national = arrays['national']
+        self.keys = arrays['keys']
+        self.cumulative = arrays['cumulative']
+        self.first_year = int(self.years[0])
+        self.last_year = int(self.years[-1])
+
+    @classmethod
+    def load(cls, csv_path=CSV_PATH):
+        return cls(load_derived('cube', build_cube_arrays, csv_path))
+
+    def name_code(self, name):
+        """Integer code of a name, -1 if it never appears in the data."""
+        code = int(np.searchsorted(self.names, name))
+        if code < len(self.names) and self.names[code] == name:
+            return code
+        return -1
+
+    def dpt_code(self, dpt):
+        code = int(np.searchsorted(self.dpts, dpt))
+        if code < len(self.dpts) and self.dpts[code] == dpt:
+            return code
+        return -1
+
+    def year_span(self, year_min, year_max):
+        # clipped [lo, hi) year indexes, empty when the range misses the data
+        lo = max(year_min, self.first_year) - self.first_year
+        hi = min(year_max, self.last_year) - self.first_year + 1
+        return lo, max(lo, hi)
+
+    def _sex_indexes(self, sex):
+        return np.arange(2) if sex is None else np.array([SEXES.index(sex)])
+
+    def range_sums(self, name_codes, dpt_codes, year_min, year_max, sex=None):
+        """Births for each (name_codes[i], dpt_codes[i]) pair between year_min and year_max."""
+        name_codes = np.asarray(name_codes, dtype=np.int64)
+        dpt_codes = np.asarray(dpt_codes, dtype=np.int64)
+        lo, hi = self.year_span(year_min, year_max)
+        n_years = len(self.years)
+        cells = (name_codes * len(self.dpts) + dpt_codes)[:, None] * 2 + self._sex_indexes(sex)[None, :]
+        start = np.searchsorted(self.keys, cells * n_years + lo)
+        stop = np.searchsorted(self.keys, cells * n_years + hi)
+        return (self.cumulative[stop] - self.cumulative[start]).sum(axis=1)
+
+    def births_per_department(self, name, year_min, year_max, sex=None):
+        """Births of name in every department (aligned with self.dpts) between year_min and year_max."""
+        code = self.name_code(name)
+        if code < 0:
+            return np.zeros(len(self.dpts), dtype=np.int64)
+        dpt_codes = np.arange(len(self.dpts))
+        return self.range_sums(np.full(len(dpt_codes), code), dpt_codes, year_min, year_max, sex)
+
+    def births_per_department_year(self, name, sex=None):
+        """Births of name per department (aligned with self.dpts) and year (aligned with self.years)."""
+        n_dpts, n_years = len(self.dpts), len(self.years)
+        births = np.zeros((n_dpts, n_years), dtype=np.int64)
+        code = self.name_code(name)
+        if code < 0:
+            return births
+        # the rows of one name are a contiguous slice of the sorted keys
+        first = code * n_dpts * 2 * n_years
+        start, stop = np.searchsorted(self.keys, [first, first + n_dpts * 2 * n_years])
+        cells, year = np.divmod(self.keys[start:stop] - first, n_years)
+        dpt, sex_index = np.divmod(cells, 2)
+        counts = np.diff(self.cumulative[start:stop + 1])
+        keep = slice(None) if sex is None else sex_index == SEXES.index(sex)
+        np.add.at(births, (dpt[keep], year[keep]), counts[keep])
+        return births
+
+    def births_per_year(self, name, year_min=None, year_max=None):
+        """National births of name per year and sex, shape (years, 2), with the matching years."""
+        year_min = self.first_year if year_min is None else year_min
+        year_max = self.last_year if year_max is None else year_max
+        lo, hi = self.year_span(year_min, year_max)
+        code = self.name_code(name)
+        if code < 0:
+            return self.years[lo:hi], np.zeros((hi - lo, 2), dtype=np.int64)
+        return self.years[lo:hi], np.diff(self.national[code, lo:hi + 1].astype(np.int64), axis=0)
+
+    def births_per_name_year(self, names, year_min, year_max):
+        """National births per name, year and sex, shape (names, year_max - year_min + 1, 2).
+
+        Every year of the range has a row, zeros for unknown names and for
+        the years outside the data.
+        """
+        births = np.zeros((len(names), max(0, year_max - year_min + 1), 2), dtype=np.int64)
+        codes = np.array([self.name_code(name) for name in names], dtype=np.int64)
+        lo, hi = self.year_span(year_min, year_max)
+        known = np.flatnonzero(codes >= 0)
+        if len(known) and lo < hi:
+            offset = self.first_year + lo - year_min
+            births[known, offset:offset + hi - lo] = np.diff(self.national[codes[known], lo:hi + 1].astype(np.int64), axis=1)
+        return births
+
+    def name_year_matrix(self):
+        """National births per name and year summed over sexes, shape (names, years)."""
+        return np.diff(self.national.sum(axis=2, dtype=np.int64), axis=1).astype(np.int32)
+
+    def name_totals(self, year_min, year_max, sex=None):
+        """National births of every name (aligned with self.names) between year_min and year_max."""
+        lo, hi = self.year_span(year_min, year_max)
+        totals = self.national[:, hi, :].astype(np.int64) - self.national[:, lo, :]
+        if sex is None:
+            return totals.sum(axis=1)
+        return totals[:, SEXES.index(sex)]
+
+    def top_names(self, year_min, year_max, num_names=10):
+        """Most given names nationally between year_min and year_max, most common first."""
+        totals = self.name_totals(year_min, year_max)
+        order = np.argsort(-totals, kind='stable')[:num_names]
+        return self.names[order[totals[order] > 0]].tolist()
@@ -0,0 +1,37 @@
+# Which of many curves is under the mouse pointer.
+#
+# The curves of visu1 share their x values (the years). For each x the values
+# of all the curves are sorted once, so a pointer position is resolved with
+# one searchsorted in the column of the nearest x instead of a hit test of
+# every line.
+import numpy as np
+
+
+class CurveIndex:
+    """Nearest-point lookup over curves values (n_curves, len(xs)) drawn at the same xs."""
+
+    def __init__(self, xs, values):
+        self.xs = np.asarray(xs)
+        self.values = np.asarray(values)
+        # column x of order / sorted: the curves by increasing value at xs[x]
+        self.order = np.argsort(self.values, axis=0, kind='stable').T.copy()
+        self.sorted = np.take_along_axis(self.values, self.order.T, axis=0).T.copy()
+
+    def __len__(self):
+        return len(self.values)
+
+    def column(self, x):
+        """Index of the x value nearest to x."""
+        i = int(np.clip(np.searchsorted(self.xs, x), 1, len(self.xs) - 1))
+        return i - 1 if x - self.xs[i - 1] <= self.xs[i] - x else i
+
+    def nearest(self, x, y, tolerance):
+        """Curve whose value at the x nearest to x is the closest to y, None if none is within tolerance."""
+        if not len(self.values):
+            return None
+        column = self.column(x)
+        lo, hi = np.searchsorted(self.sorted[column], [y - tolerance, y + tolerance])
+        if lo == hi:
+            return None
+        candidates = self.order[column, lo:hi]
+        return int(candidates[np.argmin(np.abs(self.values[candidates, column] - y))])
@@ -0,0 +1,395 @@
+# Loading of the INSEE dpt2020.csv file through a binary columnar cache.
+#
+# The first load parses the CSV by chunks of CHUNK_ROWS rows, drops the rows
+# the apps never use (_PRENOMS_RARES, the 'XX' department, unknown years) and
+# appends every column to a typed .npy file, so memory does not grow with the
+# file. Later loads memory-map those files, which takes milliseconds instead
+# of the several seconds needed by pd.read_csv. A new yearly release can be
+# added to the cache of the previous one without parsing the earlier years
+# again (append_years).
+#
+# The memory-mapped files are read-only and shared through the page cache by
+# every process using them, e.g. the workers of panel serve --num-procs. The
+# builds take a file lock, so when several processes start at once one of them
+# builds while the others wait and then map its files.
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent builds are still correct, only wasted work
+    fcntl = None
+try:
+    import resource
+except ImportError:  # Windows: the peak memory is not reported
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# BABYNAMES_CSV selects another file, e.g. a synthetic one (babynames.synthetic)
+CSV_PATH = os.environ.get('BABYNAMES_CSV', os.path.join(ROOT, 'dpt2020.csv'))
+CACHE_DIR = os.path.join(ROOT, '.cache')
+
+# bump when the layout of the cached columns changes
+CACHE_VERSION = 1
+
+# columns stored as integer codes plus a dictionary of distinct values
+CODED_COLUMNS = ['preusuel', 'dpt']
+PLAIN_COLUMNS = {'sexe': np.uint8, 'annais': np.int16, 'nombre': np.uint32}
+# rows parsed at a time when building the cache
+CHUNK_ROWS = 200_000
+
+
+def file_hash(path):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cache_dir_for(csv_path):
+    # files of the same name in different folders, e.g. a synthetic dpt2020.csv, get their own cache
+    path = os.path.realpath(csv_path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(CACHE_DIR, f'{stem}-{hashlib.sha1(path.encode()).hexdigest()[:10]}')
+
+
+def _numbers(column):
+    # the parser already made numbers of the columns without any text in this chunk
+    if pd.api.types.is_numeric_dtype(column):
+        return column
+    return pd.to_numeric(column, errors='coerce')
+
+
+def clean_chunk(chunk, report):
+    """Keep the rows the apps use and convert their columns, counting the dropped rows in report.
+
+    The rare names (_PRENOMS_RARES) and the unknown department (XX) are
+    dropped, as are rows whose year, sex or count is not a number: the year is
+    'XXXX' on the rows of births whose year is unknown.
+    """
+    rare = chunk['preusuel'] == '_PRENOMS_RARES'
+    unknown_dpt = ~rare & (chunk['dpt'] == 'XX')
+    annais = _numbers(chunk['annais'])
+    sexe = _numbers(chunk['sexe'])
+    nombre = _numbers(chunk['nombre'])
+    invalid = ~rare & ~unknown_dpt & (annais.isna() | ~sexe.isin([1, 2]) | nombre.isna() | (nombre < 0)
+                                      | (chunk['preusuel'] == '') | (chunk['dpt'] == ''))
+    keep = ~(rare | unknown_dpt | invalid)
+    report['rows_read'] += len(chunk)
+    report['dropped_rare'] += int(rare.sum())
+    report['dropped_unknown_dpt'] += int(unknown_dpt.sum())
+    report['dropped_invalid'] += int(invalid.sum())
+    return pd.DataFrame({
+        'sexe': sexe[keep].to_numpy(dtype=PLAIN_COLUMNS['sexe']),
+        'preusuel': chunk['preusuel'][keep].to_numpy(),
+        'annais': annais[keep].to_numpy(dtype=PLAIN_COLUMNS['annais']),
+        'dpt': chunk['dpt'][keep].to_numpy(),
+        'nombre': nombre[keep].to_numpy(dtype=PLAIN_COLUMNS['nombre']),
+    })
+
+
+def new_report():
+    return dict.fromkeys(['rows_read', 'dropped_rare', 'dropped_unknown_dpt', 'dropped_invalid',
+                          'skipped_known_years', 'rows', 'chunks'], 0)
+
+
+def read_clean_chunks(csv_path=CSV_PATH, report=None, chunk_rows=CHUNK_ROWS):
+    """Cleaned rows of the CSV, chunk_rows at a time, so that memory does not grow with the file."""
+    report = new_report() if report is None else report
+    # low_memory=False: each chunk is typed as a whole, its size already bounds the memory
+    reader = pd.read_csv(csv_path, sep=';', keep_default_na=False, dtype={'preusuel': str, 'dpt': str},
+                         chunksize=chunk_rows, low_memory=False)
+    with reader:
+        for chunk in reader:
+            report['chunks'] += 1
+            yield clean_chunk(chunk, report)
+
+
+class _CodedColumnWriter:
+    """Integer codes of a string column written to disk chunk by chunk.
+
+    The codes follow the order in which the values first appear; finish()
+    sorts the dictionary and renumbers the codes, a chunk at a time too.
+    """
+
+    def __init__(self, path, known_values=()):
+        self.path = path
+        self.codes = {value: code for code, value in enumerate(known_values)}
+        self.rows = 0
+        self._file = open(f'{path}.{os.getpid()}.raw', 'wb')
+
+    def append(self, values):
+        local_codes, uniques = pd.factorize(values)
+        mapping = np.array([self.codes.setdefault(value, len(self.codes)) for value in uniques], dtype=np.int32)
+        self._file.write(mapping[local_codes].tobytes())
+        self.rows += len(values)
+
+    def finish(self, cache_dir, column, known_codes=None, chunk_rows=CHUNK_ROWS):
+        """Write <column>.codes.npy (known_codes first, then the appended rows) and <column>.values.npy."""
+        self._file.close()
+        values = np.array(list(self.codes), dtype=str)
+        order = np.argsort(values, kind='stable')
+        renumber = np.empty(len(values), dtype=np.int32)
+        renumber[order] = np.arange(len(values), dtype=np.int32)
+        appended = np.memmap(self._file.name, dtype=np.int32, mode='r', shape=(self.rows,)) if self.rows else np.zeros(0, np.int32)
+        known_codes = np.zeros(0, np.int32) if known_codes is None else known_codes
+        path = os.path.join(cache_dir, f'{column}.codes.npy')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        target = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.int32, shape=(len(known_codes) + self.rows,))
+        for offset, source in [(0, known_codes), (len(known_codes), appended)]:
+            for start in range(0, len(source), chunk_rows):
+                stop = min(start + chunk_rows, len(source))
+                target[offset + start:offset + stop] = renumber[source[start:stop]]
+        target.flush()
+        del target, appended
+        os.replace(tmp, path)
+        os.remove(self._file.name)
+        _save(os.path.join(cache_dir, f'{column}.values.npy'), values[order])
+
+
+class _PlainColumnWriter:
+    def __init__(self, path, dtype):
+        self.dtype = dtype
+        self.rows = 0
+        self._file = open(f'{path}.{os.getpid()}.raw', 'wb')
+
+    def append(self, values):
+        self._file.write(np.asarray(values, dtype=self.dtype).tobytes())
+        self.rows += len(values)
+
+    def finish(self, cache_dir, column, known=None, chunk_rows=CHUNK_ROWS):
+        self._file.close()
+        appended = np.memmap(self._file.name, dtype=self.dtype, mode='r', shape=(self.rows,)) if self.rows else np.zeros(0, self.dtype)
+        known = np.zeros(0, self.dtype) if known is None else known
+        path = os.path.join(cache_dir, f'{column}.npy')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        target = np.lib.format.open_memmap(tmp, mode='w+', dtype=self.dtype, shape=(len(known) + self.rows,))
+        for offset, source in [(0, known), (len(known), appended)]:
+            for start in range(0, len(source), chunk_rows):
+                stop = min(start + chunk_rows, len(source))
+                target[offset + start:offset + stop] = source[start:stop]
+        target.flush()
+        del target, appended
+        os.replace(tmp, path)
+        os.remove(self._file.name)
+
+
+def peak_rss():
+    """Peak resident memory of the process in bytes, None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _ingest(cache_dir, meta, chunks, report, base=None):
+    """Write the cleaned chunks, after the rows of the base columns if given, as the cache of cache_dir."""
+    start = time.perf_counter()
+    os.makedirs(cache_dir, exist_ok=True)
+    coded = {column: _CodedColumnWriter(os.path.join(cache_dir, column),
+                                        () if base is None else base[f'{column}.values'].tolist())
+             for column in CODED_COLUMNS}
+    plain = {column: _PlainColumnWriter(os.path.join(cache_dir, column), dtype) for column, dtype in PLAIN_COLUMNS.items()}
+    for chunk in chunks:
+        for column, writer in {**coded, **plain}.items():
+            writer.append(chunk[column])
+        report['rows'] += len(chunk)
+    for column, writer in coded.items():
+        writer.finish(cache_dir, column, None if base is None else base[f'{column}.codes'])
+    for column, writer in plain.items():
+        writer.finish(cache_dir, column, None if base is None else base[column])
+
+    meta['rows'] = len(base['sexe']) + report['rows'] if base is not None else report['rows']
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    report['peak_rss'] = peak_rss()
+    meta['ingest'] = report
+    # meta.json is written last: its presence marks a complete cache
+    _write_meta(cache_dir, meta)
+    return meta
+
+
+def _save(path, array):
+    # write next to the target and rename so a concurrent reader never sees half a file
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(cache_dir, meta):
+    path = os.path.join(cache_dir, 'meta.json')
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=1)
+    os.replace(tmp, path)
+
+
+@contextlib.contextmanager
+def build_lock(cache_dir):
+    """Exclusive lock of cache_dir across processes, held while building files in it."""
+    os.makedirs(cache_dir, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(cache_dir, '.lock'), 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def source_meta(csv_path):
+    stat = os.stat(csv_path)
+    return {'version': CACHE_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': file_hash(csv_path)}
+
+
+def build_cache(csv_path=CSV_PATH, cache_dir=None, chunk_rows=CHUNK_ROWS):
+    """Build the columnar cache of a CSV, reading it chunk_rows at a time."""
+    cache_dir = cache_dir or cache_dir_for(csv_path)
+    report = new_report()
+    return _ingest(cache_dir, source_meta(csv_path), read_clean_chunks(csv_path, report, chunk_rows), report)
+
+
+def append_years(csv_path, base_csv=CSV_PATH, chunk_rows=CHUNK_ROWS):
+    """Build the cache of a newer release from the cache of base_csv plus its rows of later years.
+
+    Only the years after the last year of base_csv are taken from csv_path
+    (a full release or a file with the new years only): the earlier rows are
+    copied from the base cache, corrections of earlier years are ignored.
+    """
+    base = load_columns(base_csv)
+    last_year = int(base['annais'].max())
+    report = new_report()
+
+    def later_years():
+        for chunk in read_clean_chunks(csv_path, report, chunk_rows):
+            later = chunk['annais'] > last_year
+            report['skipped_known_years'] += int((~later).sum())
+            yield chunk[later]
+
+    cache_dir = cache_dir_for(csv_path)
+    meta = source_meta(csv_path)
+    meta['base'] = {'csv': os.path.basename(base_csv), 'sha1': _read_meta(cache_dir_for(base_csv))['sha1'], 'last_year': last_year}
+    with build_lock(cache_dir):
+        return _ingest(cache_dir, meta, later_years(), report, base)
+
+
+def is_cache_valid(csv_path=CSV_PATH, cache_dir=None):
+    cache_dir = cache_dir or cache_dir_for(csv_path)
+    meta = _read_meta(cache_dir)
+    if meta is None or meta.get('version') != CACHE_VERSION:
+        return False
+    stat = os.stat(csv_path)
+    if stat.st_size != meta['size']:
+        return False
+    if stat.st_mtime_ns == meta['mtime_ns']:
+        return True
+    # the file was touched, only trust the cache if the content is unchanged
+    if file_hash(csv_path) != meta['sha1']:
+        return False
+    meta['mtime_ns'] = stat.st_mtime_ns
+    _write_meta(cache_dir, meta)
+    return True
+
+
+def load_columns(csv_path=CSV_PATH, mmap=True):
+    """Return the cleaned columns as numpy arrays, building the cache if needed.
+
+    Coded columns come as '<name>.codes' (int32) and '<name>.values' (sorted
+    distinct strings), the others under their own name.
+    """
+    cache_dir = cache_dir_for(csv_path)
+    if not is_cache_valid(csv_path, cache_dir):
+        with build_lock(cache_dir):
+            # another process may have built it while we were waiting
+            if not is_cache_valid(csv_path, cache_dir):
+                build_cache(csv_path, cache_dir)
+    mmap_mode = 'r' if mmap else None
+    columns = {}
+    for column in CODED_COLUMNS:
+        columns[f'{column}.codes'] = np.load(os.path.join(cache_dir, f'{column}.codes.npy'), mmap_mode=mmap_mode)
+        columns[f'{column}.values'] = np.load(os.path.join(cache_dir, f'{column}.values.npy'), mmap_mode=mmap_mode)
+    for column in PLAIN_COLUMNS:
+        columns[column] = np.load(os.path.join(cache_dir, f'{column}.npy'), mmap_mode=mmap_mode)
+    return columns
+
+
+def source_sha1(csv_path=CSV_PATH):
+    """SHA-1 of the CSV the cache holds, building the cache if needed."""
+    load_columns(csv_path)
+    return _read_meta(cache_dir_for(csv_path))['sha1']
+
+
+def _is_fresh(stamp, sha1):
+    return stamp is not None and stamp.get('sha1') == sha1 and stamp.get('version') == CACHE_VERSION
+
+
+def load_derived(name, build, csv_path=CSV_PATH, mmap=True):
+    """Return arrays computed from the cleaned columns, cached next to them.
+
+    build(columns) must return a dict of numpy arrays. It only runs when the
+    cached arrays are missing or were computed from another version of the CSV.
+    """
+    columns = load_columns(csv_path)
+    cache_dir = cache_dir_for(csv_path)
+    sha1 = _read_meta(cache_dir)['sha1']
+    target = os.path.join(cache_dir, name)
+    stamp = _read_meta(target)
+    if not _is_fresh(stamp, sha1):
+        with build_lock(target):
+            stamp = _read_meta(target)
+            if not _is_fresh(stamp, sha1):
+                arrays = build(columns)
+                for key, array in arrays.items():
+                    _save(os.path.join(target, f'{key}.npy'), array)
+                stamp = {'version': CACHE_VERSION, 'sha1': sha1, 'arrays': sorted(arrays)}
+                _write_meta(target, stamp)
+    mmap_mode = 'r' if mmap else None
+    return {key: np.load(os.path.join(target, f'{key}.npy'), mmap_mode=mmap_mode) for key in stamp['arrays']}
+
+
+def load_names(csv_path=CSV_PATH):
+    """Cleaned dataset as a DataFrame, with categorical names and departments."""
+    columns = load_columns(csv_path)
+    frame = {}
+    for column in ['sexe', 'preusuel', 'annais', 'dpt', 'nombre']:
+        if column in CODED_COLUMNS:
+            frame[column] = pd.Categorical.from_codes(columns[f'{column}.codes'],
+                                                      categories=columns[f'{column}.values'])
+        else:
+            frame[column] = columns[column]
+    return pd.DataFrame(frame, copy=False)
+
+
+if __name__ == '__main__':
+    # python -m babynames.data [path/to/dpt2020.csv] prebuilds the cache,
+    # python -m babynames.data dpt2021.csv --append-to dpt2020.csv adds the new years to the cache of dpt2020.csv
+    parser = argparse.ArgumentParser(description='Build the columnar cache of an INSEE names file.')
+    parser.add_argument('csv', nargs='?', default=CSV_PATH)
+    parser.add_argument('--append-to', metavar='BASE_CSV', help='copy the cache of BASE_CSV and only add the later years')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    if args.append_to:
+        meta = append_years(args.csv, args.append_to, args.chunk_rows)
+    else:
+        meta = build_cache(args.csv, chunk_rows=args.chunk_rows)
+    print(json.dumps(meta, indent=1))
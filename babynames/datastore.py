@@ -0,0 +1,236 @@
+# In-memory, content-addressed store for the datasets of the Altair charts.
+#
+# The 'datastore' data transformer serializes a chart dataset once, keys it
+# by the SHA-256 of its JSON and puts the url of that key in the spec instead
+# of the values. Identical datasets, from any session, share one entry. The
+# entries live in a size-bounded LRU and are served by the Tornado handlers of
+# ROUTES, loaded with: panel serve app.py --plugins babynames.datastore
+# (babynames must be importable, e.g. PYTHONPATH=.. from an app folder).
+#
+# The store lives in the memory of one server process. With several workers
+# (panel serve --num-procs) the browser may fetch a dataset from another
+# worker than the one which built the chart: set BABYNAMES_DATASTORE_DIR to a
+# folder where every payload is also written, and which all workers read.
+# The folder is bounded too, to BABYNAMES_DATASTORE_DIR_BYTES (256 MB by
+# default, at least the number of workers times BABYNAMES_DATASTORE_BYTES so
+# that no worker loses the files of the datasets it still holds): every put
+# refreshes the modification time of its file, and the files not put for the
+# longest time are deleted when the folder grows over its budget.
+# The datasets of a static bundle (babynames.bundle, BABYNAMES_BUNDLE_DIR) are
+# read from its datastore folder the same way, without writing there.
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import altair as alt
+from tornado.web import HTTPError, RequestHandler
+
+from babynames import tracing
+from babynames.bundle import BUNDLE_DIR
+
+DATASTORE_ROUTE = 'datastore'
+DEFAULT_MAX_BYTES = int(os.environ.get('BABYNAMES_DATASTORE_BYTES', 64 * 1024 * 1024))
+SHARED_DIR = os.environ.get('BABYNAMES_DATASTORE_DIR')
+SHARED_MAX_BYTES = int(os.environ.get('BABYNAMES_DATASTORE_DIR_BYTES', 256 * 1024 * 1024))
+# the shared folder is pruned every time a process wrote this fraction of its budget
+PRUNE_FRACTION = 16
+READ_DIRS = [os.path.join(BUNDLE_DIR, DATASTORE_ROUTE)] if BUNDLE_DIR else []
+
+
+class DataStore:
+    """Thread-safe LRU of JSON payloads keyed by their SHA-256, bounded in bytes.
+
+    With a shared_dir, payloads are also written there as <key>.json and
+    the ones missing from memory are read from it, then from read_dirs. The
+    shared_dir is kept under shared_max_bytes, least recently put files first.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, shared_dir=SHARED_DIR, read_dirs=READ_DIRS,
+                 shared_max_bytes=SHARED_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.shared_dir = shared_dir
+        self.shared_max_bytes = shared_max_bytes
+        self._written = 0
+        self._read_folders = ([shared_dir] if shared_dir else []) + list(read_dirs)
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+        self.evicted = 0
+        self.served = 0
+        self.not_found = 0
+        self.bytes_served = 0
+        self.read_shared = 0
+        self.pruned = 0
+
+    def _shared_path(self, key, folder=None):
+        return os.path.join(folder or self.shared_dir, f'{key}.json')
+
+    def _write_shared(self, key, payload):
+        path = self._shared_path(key)
+        try:
+            # still in use: the pruning deletes the files not put for the longest time
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass
+        # write next to the target and rename so another worker never reads half a file
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        with self._lock:
+            self._written += len(payload)
+            prune = self._written >= self.shared_max_bytes // PRUNE_FRACTION
+            if prune:
+                self._written = 0
+        if prune:
+            self.prune_shared()
+
+    def prune_shared(self):
+        """Delete the least recently put files of the shared folder until it fits its budget."""
+        files = []
+        with os.scandir(self.shared_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.json'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:  # pruned by another worker meanwhile
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        files.sort()
+        for _, size, path in files:
+            if total <= self.shared_max_bytes:
+                break
+            try:
+                os.remove(path)
+                with self._lock:
+                    self.pruned += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def _read_shared(self, key):
+        for folder in self._read_folders:
+            try:
+                with open(self._shared_path(key, folder), 'rb') as f:
+                    return f.read()
+            except OSError:
+                pass
+        return None
+
+    def put(self, payload):
+        key = hashlib.sha256(payload).hexdigest()
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.deduplicated += 1
+            else:
+                self._entries[key] = payload
+                self._bytes += len(payload)
+                self.stored += 1
+                # the newest entry is kept even when it is bigger than the budget
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._bytes -= len(evicted)
+                    self.evicted += 1
+        # also for a deduplicated payload: refreshes its file, or writes it again if it was pruned
+        if self.shared_dir:
+            self._write_shared(key, payload)
+        return key
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+        if payload is None and self._read_folders:
+            payload = self._read_shared(key)
+            if payload is not None:
+                with self._lock:
+                    self.read_shared += 1
+        with self._lock:
+            if payload is None:
+                self.not_found += 1
+                return None
+            self.served += 1
+            self.bytes_served += len(payload)
+            return payload
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        return any(os.path.exists(self._shared_path(key, folder)) for folder in self._read_folders)
+
+    def metrics(self):
+        with self._lock:
+            puts = self.stored + self.deduplicated
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'stored': self.stored,
+                'deduplicated': self.deduplicated,
+                'hit_rate': self.deduplicated / puts if puts else 0.0,
+                'evicted': self.evicted,
+                'served': self.served,
+                'not_found': self.not_found,
+                'bytes_served': self.bytes_served,
+                'read_shared': self.read_shared,
+                'pruned': self.pruned,
+            }
+
+
+STORE = DataStore()
+
+
+def to_datastore(data, store=None):
+    """Altair data transformer: store the values and return their url."""
+    values = alt.utils.data.to_values(data)['values']
+    payload = json.dumps(values, separators=(',', ':'), sort_keys=True, default=str).encode()
+    key = (store or STORE).put(payload)
+    # downloaded by the browser along with the spec, once however many times the chart refers to it
+    tracing.note_bytes(len(payload), key)
+    return {'url': f'{DATASTORE_ROUTE}/{key}.json', 'format': {'type': 'json'}}
+
+
+alt.data_transformers.register('datastore', to_datastore)
+
+URL_PATTERN = re.compile(rf'{DATASTORE_ROUTE}/([0-9a-f]{{64}})\.json')
+
+
+def serves(spec_json, store=None):
+    """True if every datastore url of a serialized spec can still be served (none was evicted)."""
+    store = store or STORE
+    return all(key in store for key in URL_PATTERN.findall(spec_json))
+
+
+class DataStoreHandler(RequestHandler):
+    def get(self, key):
+        payload = STORE.get(key)
+        if payload is None:
+            raise HTTPError(404)
+        self.set_header('Content-Type', 'application/json')
+        # the url changes with the content, so the browser can keep it forever
+        self.set_header('Cache-Control', 'public, max-age=31536000, immutable')
+        self.write(payload)
+
+
+class DataStoreMetricsHandler(RequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(STORE.metrics()))
+
+
+ROUTES = [
+    (rf'/{DATASTORE_ROUTE}/metrics', DataStoreMetricsHandler, {}),
+    (rf'/{DATASTORE_ROUTE}/([0-9a-f]{{64}})\.json', DataStoreHandler, {}),
+]
@@ -0,0 +1,109 @@
+# Where the time of the apps goes: the stages recorded by babynames.tracing,
+# with the datastore and result cache counters, as a pane and as plain text.
+#
+# With BABYNAMES_DIAGNOSTICS=1 the apps show a pane with the rolling
+# percentiles of every stage and the breakdown of the last requests. Loaded
+# as a plugin (panel serve app.py --plugins babynames.datastore --plugins
+# babynames.diagnostics), the server answers /metrics in the Prometheus text
+# format, to clients of the same machine only.
+import os
+
+import panel as pn
+from tornado.web import HTTPError, RequestHandler
+
+from babynames import datastore, memo, tracing
+
+DIAGNOSTICS = os.environ.get('BABYNAMES_DIAGNOSTICS') == '1'
+REFRESH_MS = 2000
+METRICS_ROUTE = 'metrics'
+LOCAL_ADDRESSES = {'127.0.0.1', '::1'}
+SHOWN_TRACES = 3
+
+
+def _cell(value, format_spec):
+    return '' if value is None else format(value, format_spec)
+
+
+def stages_markdown(stages):
+    lines = ['| stage | count | p50 ms | p95 ms | p99 ms | rows | KB | cache hits |',
+             '|---|---:|---:|---:|---:|---:|---:|---:|']
+    for stage in stages:
+        size = None if stage['bytes'] is None else stage['bytes'] / 1024
+        lines.append(f"| {stage['stage']} | {stage['count']} | {stage['p50_ms']:.1f} | {stage['p95_ms']:.1f} | "
+                     f"{stage['p99_ms']:.1f} | {_cell(stage['rows'], '.0f')} | {_cell(size, '.1f')} | "
+                     f"{_cell(stage['cache_hit_rate'], '.0%')} |")
+    return '\n'.join(lines)
+
+
+def trace_markdown(trace):
+    lines = []
+    for depth, span in trace.flatten():
+        details = [f'{span.seconds * 1e3:.1f} ms']
+        if span.rows is not None:
+            details.append(f'{span.rows} rows')
+        if span.bytes is not None:
+            details.append(f'{span.bytes / 1024:.1f} KB')
+        if span.cache_hit is not None:
+            details.append('cache hit' if span.cache_hit else 'cache miss')
+        lines.append(f"{'    ' * depth}- {span.name}: {', '.join(details)}")
+    return '\n'.join(lines)
+
+
+def diagnostics_markdown(tracer=None):
+    tracer = tracer or tracing.TRACER
+    if not tracer.enabled:
+        return '**Diagnostics**: tracing is off (BABYNAMES_TRACING=0)'
+    parts = ['**Diagnostics**, over the last requests of the server', stages_markdown(tracer.summary())]
+    for trace in reversed(tracer.traces()[-SHOWN_TRACES:]):
+        parts.append(trace_markdown(trace))
+    return '\n\n'.join(parts)
+
+
+def diagnostics_pane(**params):
+    """Markdown pane refreshed every REFRESH_MS while the session is open."""
+    pane = pn.pane.Markdown(diagnostics_markdown(), **params)
+
+    def refresh():
+        pane.object = diagnostics_markdown()
+    pn.state.add_periodic_callback(refresh, period=REFRESH_MS)
+    return pane
+
+
+def _sample(name, value, labels=None):
+    if value is None:
+        return []
+    labels = '{' + ','.join(f'{key}="{label}"' for key, label in labels.items()) + '}' if labels else ''
+    return [f'{name}{labels} {value:g}' if isinstance(value, float) else f'{name}{labels} {value}']
+
+
+def metrics_text(tracer=None):
+    """Stage percentiles and counters of the cache and datastore, in the Prometheus text format."""
+    tracer = tracer or tracing.TRACER
+    lines = ['# TYPE babynames_stage_seconds summary']
+    for stage in tracer.summary():
+        labels = {'stage': stage['stage']}
+        for quantile in tracing.QUANTILES:
+            lines += _sample('babynames_stage_seconds', stage[f'p{quantile}_ms'] / 1e3,
+                             dict(labels, quantile=f'{quantile / 100:g}'))
+        lines += _sample('babynames_stage_seconds_count', stage['count'], labels)
+        lines += _sample('babynames_stage_rows', stage['rows'], labels)
+        lines += _sample('babynames_stage_bytes', stage['bytes'], labels)
+        lines += _sample('babynames_stage_cache_hit_ratio', stage['cache_hit_rate'], labels)
+    for prefix, metrics in [('babynames_result_cache', memo.RESULTS.metrics()),
+                            ('babynames_datastore', datastore.STORE.metrics())]:
+        for key, value in metrics.items():
+            lines += _sample(f'{prefix}_{key}', value)
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(RequestHandler):
+    def get(self):
+        if self.request.remote_ip not in LOCAL_ADDRESSES:
+            raise HTTPError(403)
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics_text())
+
+
+ROUTES = [
+    (rf'/{METRICS_ROUTE}', MetricsHandler, {}),
+]
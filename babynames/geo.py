@@ -0,0 +1,159 @@
+# Department geometry served to the browser as static TopoJSON files.
+#
+# The charts reference the geometry by URL and join the per-department
+# numbers with a Vega-Lite lookup transform, so the polygons are downloaded
+# (and cached) by the browser once instead of being embedded in every spec.
+# The panel apps serve the geo/ folder with: panel serve app.py --static-dirs geo=../geo
+#
+# python -m babynames.geo rebuilds the files from the department GeoJSON: the
+# overseas departments are moved into insets west of Brittany, and one
+# TopoJSON file is written per detail level.
+import json
+import math
+import os
+import sys
+
+from babynames.data import ROOT
+from babynames.topology import decode_ring, encode, ring_area
+
+GEO_DIR = os.path.join(ROOT, 'geo')
+GEO_ROUTE = 'geo'
+SOURCE_PATH = os.path.join(ROOT, 'departements-avec-outre-mer.geojson')
+SIMPLIFIED_SOURCE_PATH = os.path.join(ROOT, 'departements-version-simplifiee.geojson')
+OBJECT_NAME = 'departements'
+
+# Douglas-Peucker tolerance in degrees and quantization grid of each level
+DETAIL_LEVELS = {
+    'low': (0.025, 10000),
+    'medium': (0.008, 20000),
+    'high': (0.002, 100000),
+}
+# width in degrees of the map once the insets are placed, and the largest
+# simplification error (in pixels) accepted when choosing a level
+MAP_SPAN = 19.0
+MAX_ERROR_PIXELS = 0.75
+
+# overseas department -> (longitude, latitude) centre and width in degrees of its inset
+INSETS = {
+    '971': (-8.8, 50.6, 1.4),
+    '972': (-8.8, 49.0, 1.0),
+    '973': (-8.8, 47.1, 1.8),
+    '974': (-8.8, 45.1, 1.2),
+    '976': (-8.8, 43.5, 0.8),
+}
+
+
+def _mercator(lon, lat):
+    return math.radians(lon), math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def _inverse_mercator(x, y):
+    return math.degrees(x), math.degrees(2 * math.atan(math.exp(y)) - math.pi / 2)
+
+
+def _map_points(coordinates, function):
+    if isinstance(coordinates[0], (int, float)):
+        return list(function(*coordinates))
+    return [_map_points(c, function) for c in coordinates]
+
+
+def _points(coordinates):
+    if isinstance(coordinates[0], (int, float)):
+        yield coordinates
+    else:
+        for c in coordinates:
+            yield from _points(c)
+
+
+def place_inset(geometry, lon, lat, width):
+    """Scale and move a geometry so that it fills a box of width degrees centred on (lon, lat).
+
+    The scaling is done in Mercator coordinates, the projection of the charts,
+    so the inset keeps its shape on the map.
+    """
+    projected = _map_points(geometry['coordinates'], _mercator)
+    xs, ys = zip(*_points(projected))
+    scale = math.radians(width) / max(max(xs) - min(xs), max(ys) - min(ys))
+    cx, cy = (max(xs) + min(xs)) / 2, (max(ys) + min(ys)) / 2
+    tx, ty = _mercator(lon, lat)
+    moved = _map_points(projected, lambda x, y: _inverse_mercator(tx + (x - cx) * scale, ty + (y - cy) * scale))
+    return {'type': geometry['type'], 'coordinates': moved}
+
+
+def load_features(source=SOURCE_PATH):
+    with open(source) as f:
+        features = json.load(f)['features']
+    result = []
+    for feature in features:
+        code = feature['properties']['code']
+        geometry = feature['geometry']
+        if code in INSETS:
+            geometry = place_inset(geometry, *INSETS[code])
+        result.append({'type': 'Feature', 'geometry': geometry,
+                       'properties': {'code': code, 'nom': feature['properties']['nom']}})
+    return result
+
+
+def department_names(source=SIMPLIFIED_SOURCE_PATH):
+    """Department code -> name."""
+    with open(source) as f:
+        return {feature['properties']['code']: feature['properties']['nom'] for feature in json.load(f)['features']}
+
+
+def topology_file(level):
+    return f'{OBJECT_NAME}-{level}.topojson'
+
+
+def check_topology(topology, codes):
+    """Raise if a department code is missing or has no surface left after simplification."""
+    geometries = topology['objects'][OBJECT_NAME]['geometries']
+    found = {geometry['properties']['code']: geometry for geometry in geometries}
+    missing = set(codes) - set(found)
+    if missing:
+        raise ValueError(f'departments lost in the topology: {sorted(missing)}')
+    for code, geometry in found.items():
+        polygons = geometry['arcs'] if geometry['type'] == 'MultiPolygon' else [geometry['arcs']]
+        if not any(abs(ring_area(decode_ring(topology, polygon[0]))) > 0 for polygon in polygons):
+            raise ValueError(f'department {code} has no surface left in the topology')
+
+
+def build_topologies(source=SOURCE_PATH, target_dir=GEO_DIR):
+    features = load_features(source)
+    codes = {feature['properties']['code'] for feature in features}
+    with open(SIMPLIFIED_SOURCE_PATH) as f:
+        codes |= {feature['properties']['code'] for feature in json.load(f)['features']}
+    os.makedirs(target_dir, exist_ok=True)
+    paths = []
+    for level, (tolerance, quantization) in DETAIL_LEVELS.items():
+        topology = encode(features, OBJECT_NAME, tolerance, quantization, id_property='code')
+        check_topology(topology, codes)
+        path = os.path.join(target_dir, topology_file(level))
+        with open(path, 'w') as f:
+            json.dump(topology, f, separators=(',', ':'))
+        paths.append(path)
+    return paths
+
+
+def detail_for_width(width):
+    """Coarsest detail level whose simplification stays below a pixel on a map width pixels wide."""
+    for level, (tolerance, _) in DETAIL_LEVELS.items():
+        if tolerance * width / MAP_SPAN <= MAX_ERROR_PIXELS:
+            return level
+    return list(DETAIL_LEVELS)[-1]
+
+
+def ensure_topology(level):
+    """Path of the served TopoJSON file of a level, built from the source GeoJSON if missing."""
+    path = os.path.join(GEO_DIR, topology_file(level))
+    if not os.path.exists(path):
+        build_topologies()
+    return path
+
+
+def geometry_url(level):
+    return f'{GEO_ROUTE}/{topology_file(level)}'
+
+
+if __name__ == '__main__':
+    for path in build_topologies(*sys.argv[1:2]):
+        print(path, os.path.getsize(path), 'bytes')
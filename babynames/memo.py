@@ -0,0 +1,136 @@
+# Process-wide cache of query results and serialized chart specs.
+#
+# Every panel session runs the app script again, but the module-level RESULTS
+# cache is shared by all of them: the first user asking for MARIE between
+# 1900 and 2020 pays for the aggregation and the spec, the next ones get the
+# stored result. Entries are evicted least recently used first when the
+# memory budget is exceeded, and expire after a time to live.
+import functools
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from babynames import tracing
+
+DEFAULT_MAX_BYTES = int(os.environ.get('BABYNAMES_RESULT_CACHE_BYTES', 128 * 1024 * 1024))
+DEFAULT_TTL = float(os.environ.get('BABYNAMES_RESULT_CACHE_TTL', 3600))
+
+
+def estimate_size(value):
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return 1024
+
+
+class ResultCache:
+    """Thread-safe LRU + TTL cache bounded by an estimate of the bytes it holds."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+        self.invalidated = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key, validate=None):
+        """(True, value) if key is cached, fresh and accepted by validate, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] < time.monotonic():
+                self._drop(key)
+                self.expired += 1
+                entry = None
+            if entry is not None and validate is not None and not validate(entry[0]):
+                self._drop(key)
+                self.invalidated += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[0]
+
+    def put(self, key, value, size=None):
+        size = estimate_size(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evicted += 1
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evicted': self.evicted,
+                'expired': self.expired,
+                'invalidated': self.invalidated,
+            }
+
+
+RESULTS = ResultCache()
+
+
+def memoize(namespace, normalize=None, validate=None, cache=None):
+    """Cache a function's results in RESULTS (or cache) under (namespace, normalized arguments).
+
+    namespace must be stable across sessions: the app scripts get a new
+    module name for every session, so function names are not enough.
+    normalize(*args, **kwargs) returns the hashable part of the key, e.g.
+    the upper-cased name and integer years. validate(value) can reject a
+    cached value that is no longer usable, it is then recomputed.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            store = cache or RESULTS
+            if normalize is None:
+                key = (namespace, args, tuple(sorted(kwargs.items())))
+            else:
+                key = (namespace, normalize(*args, **kwargs))
+            found, value = store.get(key, validate)
+            # the span of the calling stage shows whether it was served from the cache
+            tracing.note_cache(found)
+            if found:
+                return value
+            value = function(*args, **kwargs)
+            store.put(key, value)
+            return value
+        return wrapper
+    return decorator
@@ -0,0 +1,242 @@
+# Memory used by the data of a process, before and after the lean data model:
+# resident set size, bytes per column of the data frames and bytes per array
+# of the structures shared by the sessions (babynames.shared).
+#
+# python -m babynames.memory [app folder] measures two new processes which
+# import the same libraries first. "before" builds the data model of the
+# original apps: the CSV read with pandas' default types, the rare names and
+# unknown departments dropped, joined to the department geometry (when
+# geopandas is installed). "after" runs the app script the way panel serve
+# does for a session and reports the arrays it holds, memory-mapped from the
+# cache (shared by the processes through the page cache) or private. The
+# summary compares the steady-state footprint of the data with the 5x
+# reduction the data model aimed at. Run from the root folder, e.g.
+# python -m babynames.memory Visualisation2. Resident memory is read from
+# /proc, so it is only reported on Linux.
+import ctypes
+import json
+import mmap
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import warnings
+
+import altair  # noqa: F401, imported before the first measure by both processes
+import numpy as np
+import pandas as pd
+import panel  # noqa: F401
+
+from babynames.data import CSV_PATH, ROOT
+
+# footprint reduction per process aimed at by the lean data model
+TARGET_RATIO = 5
+
+
+def resident_bytes():
+    """Resident set size of the current process, 0 where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return 0
+
+
+def resident_split():
+    """Resident bytes of the process by kind: total, anonymous and file-backed; empty where /proc is not available."""
+    fields = {'VmRSS': 'resident', 'RssAnon': 'anonymous', 'RssFile': 'file'}
+    split = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in fields:
+                    split[fields[key]] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return split or {'resident': resident_bytes()}
+
+
+def trim():
+    # give the freed heap back to the system, so the resident memory is the steady state
+    try:
+        ctypes.CDLL('libc.so.6').malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def column_bytes(frame):
+    """Bytes of every column of frame, counting the Python objects they reference."""
+    return frame.memory_usage(index=False, deep=True).to_dict()
+
+
+def frames_of(namespace):
+    """Data frames of namespace by variable name, each frame once."""
+    frames, seen = {}, set()
+    for name, value in namespace.items():
+        if isinstance(value, pd.DataFrame) and id(value) not in seen:
+            seen.add(id(value))
+            frames[name] = value
+    return frames
+
+
+def _root(array):
+    # the array owning the memory of a view
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def is_mapped(array):
+    """True if the memory of array is a memory-mapped file."""
+    root = _root(array)
+    return isinstance(root, np.memmap) or isinstance(root.base, mmap.mmap)
+
+
+def arrays_of(value, path, seen):
+    """(path, array) of the numpy arrays reachable from value through the babynames objects and containers.
+
+    seen holds the ids of the objects already walked and of the memory of the
+    arrays already listed, so that an array shared by two structures is counted once.
+    """
+    if id(value) in seen:
+        return
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        root = _root(value)
+        if id(root) not in seen or root is value:
+            seen.add(id(root))
+            yield path, root
+    elif isinstance(value, dict):
+        for key, item in value.items():
+            yield from arrays_of(item, f'{path}[{key!r}]', seen)
+    elif isinstance(value, (list, tuple)):
+        for index, item in enumerate(value):
+            yield from arrays_of(item, f'{path}[{index}]', seen)
+    elif type(value).__module__.startswith('babynames') and hasattr(value, '__dict__'):
+        for name, item in vars(value).items():
+            yield from arrays_of(item, f'{path}.{name}', seen)
+
+
+def shared_structures():
+    """Name -> structure of the structures of babynames.shared already loaded by this process."""
+    from babynames import shared
+    names = ['cube', 'ranking', 'rollups', 'top_index', 'mix_index']
+    return {name: getattr(shared, name)() for name in names if name in shared.LOAD_TIMES}
+
+
+def report_resident(label, start):
+    split = resident_split()
+    print(f'{label}: ' + ', '.join(f'{kind} {size / 2 ** 20:.1f} MB (+{(size - start.get(kind, 0)) / 2 ** 20:.1f})'
+                                   for kind, size in split.items()))
+    return {kind: size - start.get(kind, 0) for kind, size in split.items()}
+
+
+def report_frames(namespace):
+    """Print the columns of the data frames of namespace, return their bytes."""
+    total = 0
+    for name, frame in frames_of(namespace).items():
+        columns = column_bytes(frame)
+        total += sum(columns.values())
+        print(f'  {name}: {len(frame)} rows, {sum(columns.values()) / 2 ** 20:.1f} MB')
+        for column, size in columns.items():
+            print(f'    {column:<12} {str(frame[column].dtype):<12} {size / 2 ** 20:8.1f} MB')
+    return total
+
+
+def report_arrays(structures):
+    """Print the arrays of every structure, return their memory-mapped and private bytes."""
+    seen = set()
+    totals = {'mapped': 0, 'private': 0}
+    for name, structure in structures.items():
+        arrays = list(arrays_of(structure, name, seen))
+        mapped = sum(array.nbytes for _, array in arrays if is_mapped(array))
+        private = sum(array.nbytes for _, array in arrays if not is_mapped(array))
+        totals['mapped'] += mapped
+        totals['private'] += private
+        print(f'  {name}: {mapped / 2 ** 20:.1f} MB memory-mapped, {private / 2 ** 20:.1f} MB private')
+        for path, array in sorted(arrays, key=lambda item: -item[1].nbytes):
+            if array.nbytes >= 2 ** 16:
+                print(f'    {path:<36} {str(array.dtype):<8} {str(array.shape):<18} {array.nbytes / 2 ** 20:8.1f} MB '
+                      f'{"mapped" if is_mapped(array) else "private"}')
+    return totals
+
+
+def baseline_model(csv_path=CSV_PATH):
+    """The frames of the original Visualisation2: the births records, joined to the department geometry."""
+    with warnings.catch_warnings():
+        # read as the original apps read it, the mixed types of annais included
+        warnings.simplefilter('ignore', pd.errors.DtypeWarning)
+        names = pd.read_csv(csv_path, sep=';')
+    names = names[(names.preusuel != '_PRENOMS_RARES') & (names.dpt != 'XX')]
+    names = names.assign(annais=names['annais'].astype(int))
+    frames = {'just_names': names}
+    try:
+        import geopandas as gpd
+    except ImportError:
+        print('  geopandas is not installed: the geometry join is left out')
+        return frames
+    dpts = gpd.read_file(os.path.join(ROOT, 'departements-version-simplifiee.geojson'))
+    frames['names'] = dpts.merge(names, how='right', left_on='code', right_on='dpt').drop(columns=['code'])
+    return frames
+
+
+def measure(part, folder):
+    """Resident memory added by the data of part, 'before' or 'after', and the bytes of its frames and arrays."""
+    trim()
+    start = resident_split()
+    if part == 'before':
+        print('before: the records of the CSV, joined to the department geometry')
+        namespace = baseline_model()
+        trim()
+        result = {'resident': report_resident('  resident', start), 'frames': report_frames(namespace)}
+    else:
+        print(f'after: {folder}/app.py')
+        os.chdir(os.path.join(ROOT, folder))
+        namespace = runpy.run_path('app.py')
+        trim()
+        result = {'resident': report_resident('  resident', start), 'frames': report_frames(namespace),
+                  'arrays': report_arrays(shared_structures())}
+    return result
+
+
+def run_part(part, folder):
+    with tempfile.NamedTemporaryFile(suffix='.json') as output:
+        subprocess.run([sys.executable, '-m', 'babynames.memory', '--part', part, folder, output.name],
+                       cwd=ROOT, check=True)
+        return json.load(output)
+
+
+def print_summary(before, after):
+    old = before['resident'].get('anonymous', before['resident']['resident'])
+    new = after['resident'].get('anonymous', after['resident']['resident'])
+    arrays = after['arrays']
+    print(f'data frames: {before["frames"] / 2 ** 20:.1f} MB before, {after["frames"] / 2 ** 20:.1f} MB after')
+    print(f'arrays after: {arrays["private"] / 2 ** 20:.1f} MB private, {arrays["mapped"] / 2 ** 20:.1f} MB memory-mapped '
+          '(shared by the processes, resident only for the pages read)')
+    ratio = old / max(new, 1)
+    print(f'memory private to the process above the imports: {old / 2 ** 20:.1f} MB before, {new / 2 ** 20:.1f} MB after, '
+          f'{ratio:.1f}x smaller: the {TARGET_RATIO}x target is {"met" if ratio >= TARGET_RATIO else "missed"}')
+    old_total, new_total = before['resident']['resident'], after['resident']['resident']
+    ratio = old_total / max(new_total, 1)
+    print(f'resident memory above the imports, memory-mapped pages included: {old_total / 2 ** 20:.1f} MB before, '
+          f'{new_total / 2 ** 20:.1f} MB after, {ratio:.1f}x smaller: the {TARGET_RATIO}x target is '
+          f'{"met" if ratio >= TARGET_RATIO else "missed"}')
+
+
+def main():
+    if sys.argv[1:2] == ['--part']:
+        part, folder, output = sys.argv[2:5]
+        result = measure(part, folder)
+        with open(output, 'w') as f:
+            json.dump(result, f)
+        return
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'Visualisation2'
+    before = run_part('before', folder)
+    after = run_part('after', folder)
+    print_summary(before, after)
+
+
+if __name__ == '__main__':
+    main()
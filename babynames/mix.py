@@ -0,0 +1,93 @@
+# Precomputed gender mix of every name, for the "most mixed names" of Visualisation3.
+#
+# The balance of a name is |male - female| births (absolute) or that
+# difference divided by its births (relative, 0 for a perfectly mixed name,
+# 1 for a name given to one sex only). The totals over any year interval come
+# from the cube prefix sums; the ranking over all the years, the one the app
+# asks for by default, is stored sorted.
+import numpy as np
+
+from babynames.data import CSV_PATH, load_derived
+
+MIN_TOTAL = 2000
+
+
+def _balances(totals):
+    diff = np.abs(totals[:, 0] - totals[:, 1])
+    births = totals.sum(axis=1)
+    relative = np.divide(diff, births, out=np.ones(len(diff)), where=births > 0)
+    return diff, relative
+
+
+def _most_mixed(totals, num_names, min_total, relative):
+    diff, ratio = _balances(totals)
+    codes = np.flatnonzero(totals.sum(axis=1) >= min_total)
+    # codes follow the alphabetical order of the names, which breaks the ties
+    order = np.argsort((ratio if relative else diff)[codes], kind='stable')
+    return codes[order[:num_names]]
+
+
+def build_mix_arrays(cube):
+    per_year = np.diff(cube.national.astype(np.int64), axis=1)
+    totals = per_year.sum(axis=1)
+    births = per_year.sum(axis=2)
+    year_balance = np.full(births.shape, np.nan, dtype=np.float32)
+    np.divide(per_year[:, :, 0] - per_year[:, :, 1], births, out=year_balance, where=births > 0)
+    return {
+        'totals': totals,
+        'year_balance': year_balance,
+        'mixed': _most_mixed(totals, len(totals), MIN_TOTAL, False).astype(np.int32),
+        'mixed_relative': _most_mixed(totals, len(totals), MIN_TOTAL, True).astype(np.int32),
+    }
+
+
+class GenderMixIndex:
+    """Male and female totals, balance and most mixed names, nationally."""
+
+    def __init__(self, cube, arrays):
+        self.cube = cube
+        self.all_totals = arrays['totals']
+        self.year_balance = arrays['year_balance']
+        self.mixed = arrays['mixed']
+        self.mixed_relative = arrays['mixed_relative']
+
+    @classmethod
+    def load(cls, cube, csv_path=CSV_PATH):
+        return cls(cube, load_derived('mix', lambda columns: build_mix_arrays(cube), csv_path))
+
+    def _whole_period(self, year_min, year_max):
+        return ((year_min is None or year_min <= self.cube.first_year)
+                and (year_max is None or year_max >= self.cube.last_year))
+
+    def totals(self, year_min=None, year_max=None):
+        """Male and female births of every name (aligned with cube.names), shape (names, 2)."""
+        if self._whole_period(year_min, year_max):
+            return self.all_totals
+        year_min = self.cube.first_year if year_min is None else year_min
+        year_max = self.cube.last_year if year_max is None else year_max
+        lo, hi = self.cube.year_span(year_min, year_max)
+        return self.cube.national[:, hi, :].astype(np.int64) - self.cube.national[:, lo, :]
+
+    def balance(self, name, year_min=None, year_max=None):
+        """(male, female, |male - female|, relative balance) of name, None if it is unknown."""
+        code = self.cube.name_code(name)
+        if code < 0:
+            return None
+        male, female = (int(n) for n in self.totals(year_min, year_max)[code])
+        diff = abs(male - female)
+        return male, female, diff, diff / (male + female) if male + female else 1.0
+
+    def balance_per_year(self, name):
+        """Years and (male - female) / births of name for each of them, NaN without birth."""
+        code = self.cube.name_code(name)
+        if code < 0:
+            return self.cube.years, np.full(len(self.cube.years), np.nan, dtype=np.float32)
+        return self.cube.years, self.year_balance[code]
+
+    def most_mixed(self, year_min=None, year_max=None, num_names=20, min_total=MIN_TOTAL, relative=False):
+        """Names with at least min_total births between year_min and year_max, most balanced first."""
+        if self._whole_period(year_min, year_max) and min_total == MIN_TOTAL:
+            codes = (self.mixed_relative if relative else self.mixed)[:num_names]
+        else:
+            codes = _most_mixed(self.totals(year_min, year_max), num_names, min_total, relative)
+        return self.cube.names[codes].tolist()
@@ -0,0 +1,646 @@
+# Queries and chart specs of the panel apps, without any widget.
+#
+# Visualisation2 (map of the births of a name per department) and
+# Visualisation3 (gender pyramid) display what the functions below return.
+# They only read the arrays shared by the process (babynames.shared), loaded
+# on the first call, so the module can be imported and called without panel
+# or a display. The datasets of the charts go through the active Altair data
+# transformer, 'datastore' in the apps.
+#
+# python -m babynames.queries <folder> renders the charts and tables of every
+# name above a popularity threshold into a static bundle (babynames.bundle),
+# spreading the names over a process pool, e.g.
+# python -m babynames.queries bundle --min-total 5000 --ranges 1900-2020 1950-1999
+import argparse
+import functools
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import altair as alt
+import numpy as np
+import pandas as pd
+
+from babynames import bundle, datastore, shared, tracing
+from babynames.data import source_sha1
+from babynames.geo import GEO_ROUTE, OBJECT_NAME, detail_for_width, ensure_topology, geometry_url, topology_file
+from babynames.memo import memoize
+from babynames.regions import LEVELS
+
+# the polygons are a static TopoJSON file (panel serve app.py --static-dirs geo=../geo) fetched once
+# by the browser, at the detail level matching the width of the map
+MAP_WIDTH = 800
+GEOMETRY_LEVEL = detail_for_width(MAP_WIDTH)
+DEFAULT_PYRAMID_NAMES = "Dominique,Frédérique,Charlie,Camille,Pascal,Pascale"
+# births over all the years for a name to be bundled, and memory of the datastore of a batch worker
+DEFAULT_MIN_TOTAL = 1000
+BATCH_STORE_BYTES = 4 * 1024 * 1024
+
+# the requests without births, and the names of the pyramids, are logged at the DEBUG level
+logger = logging.getLogger(__name__)
+
+
+def geometry_data():
+    ensure_topology(GEOMETRY_LEVEL)
+    return alt.Data(url=geometry_url(GEOMETRY_LEVEL), format=alt.DataFormat(type='topojson', feature=OBJECT_NAME))
+
+# results and chart specs are cached for all the sessions of the server process (babynames.memo),
+# under keys that do not depend on the case of the name or on the type of the years
+@memoize('queries.top_names', normalize=lambda year_min, year_max, num_names=10: (int(year_min), int(year_max), num_names))
+def get_most_common_names(year_min, year_max, num_names=10) -> list[str]:
+    return shared.top_index().top_names(year_min, year_max, num_names)
+
+@memoize('queries.top_names_per_department',
+         normalize=lambda year_min, year_max, name, num_names=1, level='department':
+             (int(year_min), int(year_max), name.strip().upper(), num_names, level))
+def get_most_common_names_per_department(year_min, year_max, name, num_names=1, level='department') -> dict[list[str]]:
+    name = name.strip().upper()
+    #All departments (or regions, from the precomputed rollups) are ranked in one pass,
+    #the rank of the special name is -1 where it has no birth
+    ranks = shared.rollups().rank(year_min, year_max, level)
+    return ranks.top(num_names), ranks.rank_of(name)
+
+# the map keeps the department polygons at every level: a department shows the births of its region
+LEVEL_TITLES = {'department': 'département', 'region': 'région', 'old_region': 'région (avant 2016)', 'nation': 'pays'}
+
+def department_rows(births, level):
+    # births follow the units of the level on their first axis, returns the departments whose unit has births,
+    # the label of that unit and its births
+    cube, rollups = shared.cube(), shared.rollups()
+    dpt_unit = rollups.dpt_units[level]
+    rows = births[np.maximum(dpt_unit, 0)]
+    keep = (dpt_unit >= 0) & rows.reshape(len(rows), -1).any(axis=1)
+    if level == 'department':
+        department_names = shared.department_names()
+        labels = [department_names.get(dpt, dpt) for dpt in cube.dpts[keep].tolist()]
+    else:
+        labels = rollups.units[level][dpt_unit[keep]].tolist()
+    return cube.dpts[keep], labels, rows[keep]
+
+def load_plain_data(name, min_year=1900, max_year=2020):
+    geometry = geometry_data()
+
+    selection = alt.selection_point(fields=['nom'], empty=True, on='click')
+
+    chart = alt.Chart(geometry).mark_geoshape(
+        fill='lightgray',
+        stroke='black'
+    ).transform_calculate(
+        code='datum.properties.code',
+        nom='datum.properties.nom'
+    ).encode(
+        opacity=alt.condition(selection, alt.value(1), alt.value(1)),
+        tooltip=[
+            alt.Tooltip('code:N', title='Code'),
+            alt.Tooltip('nom:N', title='Name')
+        ]
+    ).properties(
+        width=MAP_WIDTH,
+        height=600,
+        title=f'Aucune naissance avec le nom: {name} entre {min_year} et {max_year} en France'
+    ).add_params(
+        selection
+    ).project('mercator')
+
+    shadow_bar = alt.Chart(pd.DataFrame({'Cumulative Births': ['Total'], 'nombre': [0]})).mark_bar(
+        color='lightgrey'
+    ).encode(
+        x=alt.X('Cumulative Births:N', title=''),
+        y=alt.Y('nombre:Q', title='nombre de naissances cumulées pour les départements sélectionnés')
+    ).properties(
+        width=50,
+        height=400
+    )
+
+
+    return (chart | shadow_bar).configure_title(
+        fontSize=10
+    ).configure_axis(
+        labelFontSize=7.5,
+        titleFontSize=9
+    ).configure_legend(
+        labelFontSize=7.5,
+        titleFontSize=9
+    )
+
+def plot_name_all_years(name, min_year=1900, max_year=2020, level='department'):
+    name = name.upper()
+    geometry = geometry_data()
+    if shared.cube().name_code(name) < 0 or min_year > max_year or min_year < 1900 or max_year > 2020:
+        logger.debug('unknown name or invalid years: %s between %s and %s', name, min_year, max_year)
+        return load_plain_data(name), False
+
+    with tracing.span('map.aggregate') as span:
+        births = shared.rollups().births_per_unit(name, min_year, max_year, level)
+        span.rows = int(np.count_nonzero(births))
+
+    if not births.any():
+        logger.debug('no births of %s between %s and %s', name, min_year, max_year)
+        return load_plain_data(name, min_year, max_year), False
+    
+    # only the code -> count table goes into the spec, the polygons come from the geometry url
+    codes, labels, births = department_rows(births, level)
+    counts = pd.DataFrame({'code': codes, 'nom': labels, 'nombre': births})
+    # one bar row per unit, the departments of a region share theirs
+    unit_counts = counts.drop_duplicates('nom')
+
+    selection = alt.selection_point(fields=['nom'], empty=True, on='click')
+
+    chart = alt.Chart(geometry).mark_geoshape(
+        stroke='black'
+    ).transform_calculate(
+        code='datum.properties.code'
+    ).transform_lookup(
+        lookup='code',
+        from_=alt.LookupData(counts, key='code', fields=['nom', 'nombre'])
+    ).encode(
+        color= alt.Color('nombre:Q', title='Nombre', scale=alt.Scale(scheme='oranges')),
+        tooltip=[
+            alt.Tooltip('code:N', title='Code'),
+            alt.Tooltip('nom:N', title='Name'),
+            alt.Tooltip('nombre:Q', title='Nombre')
+        ],
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.4))
+    ).properties(
+        width=MAP_WIDTH,
+        height=600,
+        title=f'Nombre de naissances du prénom {name} par {LEVEL_TITLES[level]} entre {min_year} et {max_year}'
+    ).add_params(
+        selection
+    ).project('mercator')
+
+    shadow_bar = alt.Chart(unit_counts).mark_bar(
+        color='lightgrey'
+    ).encode(
+        x=alt.X('Cumulative Births:N', title=''),
+        y=alt.Y('sum(nombre):Q', title='nombre de naissances cumulées pour les départements sélectionnés')
+    ).properties(
+        width=50,
+        height=400
+    )
+
+    selected_bar = alt.Chart(unit_counts).mark_bar().encode(
+        x=alt.X('Cumulative Births:N', title=''),
+        y=alt.Y('sum(nombre):Q'),
+        tooltip=[
+            alt.Tooltip('sum(nombre):Q', title='nombre de naissances cumulées')
+        ]
+    ).transform_filter(
+        selection
+    ).properties(
+        width=50,
+        height=400,
+        title='nombre de naissances cumulées pour les départements sélectionnés'
+    )
+
+    bar_chart = shadow_bar + selected_bar
+
+    return (chart | bar_chart).configure_title(
+        fontSize=10
+    ).configure_axis(
+        labelFontSize=7.5,
+        titleFontSize=9
+    ).configure_legend(
+        labelFontSize=7.5,
+        titleFontSize=9
+    ), True
+
+def plot_name_years(name, min_year=1900, max_year=2020, level='department'):
+    # the births of every department and year are sent once: the year range is chosen with the
+    # sliders of the chart and applied by the browser, min_year and max_year are only their initial values
+    name = name.upper()
+    cube, geometry = shared.cube(), geometry_data()
+    with tracing.span('map.aggregate') as span:
+        births = shared.rollups().births_per_unit_year(name, level)
+        span.rows = int(np.count_nonzero(births))
+    if not births.any():
+        logger.debug('unknown name or no births: %s', name)
+        return load_plain_data(name), False
+
+    first_year, last_year = cube.first_year, cube.last_year
+    # one row per department with the births per year of its unit, unpacked by the flatten and window transforms
+    codes, labels, births = department_rows(births, level)
+    counts = pd.DataFrame({'code': codes, 'nom': labels, 'births': [row.tolist() for row in births]})
+
+    year_min = alt.param(name='year_min', value=min(max(min_year, first_year), last_year),
+                         bind=alt.binding_range(min=first_year, max=last_year, step=1, name='Année min '))
+    year_max = alt.param(name='year_max', value=max(min(max_year, last_year), first_year),
+                         bind=alt.binding_range(min=first_year, max=last_year, step=1, name='Année max '))
+    single_year = alt.param(name='single_year', value=False,
+                            bind=alt.binding_checkbox(name="Seulement l'année max (faire glisser pour animer) "))
+    selection = alt.selection_point(fields=['nom'], empty=True, on='click')
+
+    in_range = alt.Chart(counts).transform_flatten(
+        ['births']
+    ).transform_window(
+        year_index='row_number()',
+        groupby=['code']
+    ).transform_calculate(
+        annais=f'{first_year} + datum.year_index - 1'
+    ).transform_filter(
+        'single_year ? datum.annais == year_max : datum.annais >= year_min && datum.annais <= year_max'
+    ).transform_aggregate(
+        nombre='sum(births)',
+        groupby=['code', 'nom']
+    ).transform_filter(
+        'datum.nombre > 0'
+    )
+
+    background = alt.Chart(geometry).mark_geoshape(
+        fill='lightgray',
+        stroke='black'
+    )
+
+    chart = in_range.transform_lookup(
+        lookup='code',
+        from_=alt.LookupData(geometry, key='properties.code'),
+        as_='geo'
+    ).mark_geoshape(
+        stroke='black'
+    ).encode(
+        shape='geo:G',
+        color= alt.Color('nombre:Q', title='Nombre', scale=alt.Scale(scheme='oranges')),
+        tooltip=[
+            alt.Tooltip('code:N', title='Code'),
+            alt.Tooltip('nom:N', title='Name'),
+            alt.Tooltip('nombre:Q', title='Nombre')
+        ],
+        opacity=alt.condition(selection, alt.value(1), alt.value(0.4))
+    ).add_params(
+        selection,
+        year_min,
+        year_max,
+        single_year
+    )
+
+    period = "(single_year ? 'en ' + year_max : 'entre ' + year_min + ' et ' + year_max)"
+    title = f'Nombre de naissances du prénom {name} par {LEVEL_TITLES[level]} '
+    map_chart = (background + chart).properties(
+        width=MAP_WIDTH,
+        height=600,
+        title=alt.TitleParams(alt.ExprRef(f"{json.dumps(title)} + {period}"))
+    ).project('mercator')
+
+    # one bar row per unit, the departments of a region share theirs
+    unit_range = in_range.transform_aggregate(
+        nombre='max(nombre)',
+        groupby=['nom']
+    )
+
+    shadow_bar = unit_range.mark_bar(
+        color='lightgrey'
+    ).encode(
+        x=alt.X('Cumulative Births:N', title=''),
+        y=alt.Y('sum(nombre):Q', title='nombre de naissances cumulées pour les départements sélectionnés')
+    ).properties(
+        width=50,
+        height=400
+    )
+
+    selected_bar = unit_range.mark_bar().encode(
+        x=alt.X('Cumulative Births:N', title=''),
+        y=alt.Y('sum(nombre):Q'),
+        tooltip=[
+            alt.Tooltip('sum(nombre):Q', title='nombre de naissances cumulées')
+        ]
+    ).transform_filter(
+        selection
+    ).properties(
+        width=50,
+        height=400,
+        title='nombre de naissances cumulées pour les départements sélectionnés'
+    )
+
+    bar_chart = shadow_bar + selected_bar
+
+    return (map_chart | bar_chart).configure_title(
+        fontSize=10
+    ).configure_axis(
+        labelFontSize=7.5,
+        titleFontSize=9
+    ).configure_legend(
+        labelFontSize=7.5,
+        titleFontSize=9
+    ), True
+
+def chart_key(name, min_year=1900, max_year=2020, in_browser=False, level='department'):
+    return name.strip().upper(), int(min_year), int(max_year), bool(in_browser), level
+
+def map_bundle_key(name, min_year, max_year, in_browser, level):
+    return 'map-years' if in_browser else 'map', level, f'{min_year}-{max_year}', name
+
+# the serialized spec is cached, it is only valid while the datasets it references are in the datastore
+@memoize('queries.map', normalize=chart_key, validate=lambda result: datastore.serves(result[0]))
+def map_spec(name, min_year=1900, max_year=2020, in_browser=False, level='department'):
+    name, min_year, max_year, in_browser, level = chart_key(name, min_year, max_year, in_browser, level)
+    # popular names may have been rendered in advance, only valid charts are bundled
+    bundled = bundle.read_spec(*map_bundle_key(name, min_year, max_year, in_browser, level))
+    if bundled is not None:
+        return bundled, True
+    plot = plot_name_years if in_browser else plot_name_all_years
+    with tracing.span('map.chart'):
+        chart, valid = plot(name, min_year, max_year, level)
+    # the payload of the request: the spec, and the datasets counted by the datastore
+    with tracing.span('map.serialize'):
+        spec = json.dumps(chart.to_dict())
+        tracing.note_bytes(len(spec))
+    return spec, valid
+
+year_slider = alt.binding_range(min=1900, max=2020, step=1, name='Year:')
+select_year = alt.selection_single(fields=['annais'], bind=year_slider)
+
+def unpack_pyramid_data(chart, min_year):
+    # {preusuel, m: [...], f: [...]} -> one {preusuel, annais, sexe, nombre} row per name, year and sex
+    return chart.transform_flatten(
+        ['m', 'f']
+    ).transform_window(
+        year_index='row_number()',
+        groupby=['preusuel']
+    ).transform_calculate(
+        annais=f'{min_year} + datum.year_index - 1'
+    ).transform_fold(
+        ['m', 'f'],
+        as_=['sex_key', 'nombre']
+    ).transform_calculate(
+        sexe="datum.sex_key == 'm' ? 1 : 2"
+    )
+
+def pyramid_chart(names, min_year=1900, max_year=2020):
+    names = [name for name in names.upper().split(",") if name]
+
+    if len(names) == 0:
+        # default names: the 20 names with at least 2000 births whose male and female births are the closest
+        names = shared.mix_index().most_mixed(num_names=20)
+    logger.debug('names taken: %s', names)
+
+    # counts of every (name, sex, year), zeros included, read from the cube: one row per name
+    # with a column array per sex, unpacked in the browser by unpack_pyramid_data
+    with tracing.span('pyramid.aggregate') as span:
+        births = shared.cube().births_per_name_year(list(dict.fromkeys(names)), min_year, max_year)
+        span.rows = int(np.count_nonzero(births))
+    subset = pd.DataFrame({'preusuel': list(dict.fromkeys(names)),
+                           'm': [counts[:, 0].tolist() for counts in births],
+                           'f': [counts[:, 1].tolist() for counts in births]})
+
+    base = unpack_pyramid_data(alt.Chart(subset), min_year).transform_calculate(
+        gender=alt.expr.if_(alt.datum.sexe == 1, 'Male', 'Female')
+    ).add_selection(
+        select_year
+    ).transform_filter(
+        select_year
+    ).properties(
+        width=250,
+        height=round(33.5*len(names))
+    )
+
+    color_scale = alt.Scale(domain=['Male', 'Female'],
+                            range=['#1f77b4', '#e377c2'])
+    area_color_scale = alt.Scale(domain=['Male', 'Female'],
+                            range=['#1f77b499', '#e377c299'])
+
+
+    left = base.transform_filter(
+        select_year
+    ).transform_filter(
+        alt.datum.sexe == 2
+    ).encode(
+        alt.Y('preusuel:O').axis(None),
+        alt.X('nombre:Q')
+        .title('birth')
+        .sort('descending'),
+        alt.Color('gender:N')
+        .scale(color_scale)
+        .legend(None)
+    ).mark_bar().properties(title='Female')
+
+    middle = base.transform_filter(
+        select_year
+    ).encode(
+        alt.Y('preusuel:O').axis(None),
+        alt.Text('preusuel:O'),
+    ).mark_text().properties(width=20)
+
+    right = base.transform_filter(
+        select_year
+    ).transform_filter(
+        alt.datum.sexe == 1
+    ).encode(
+        alt.Y('preusuel:O').axis(None),
+        alt.X('nombre:Q').title('birth'),
+        alt.Color('gender:N').scale(color_scale).legend(None)
+    ).mark_bar().properties(title='Male')
+
+
+    # the data is unpacked by the layer: transforms of the layers themselves cannot be faceted
+    base_evol = alt.Chart().transform_calculate(
+        gender=alt.expr.if_(alt.datum.sexe == 1, 'Male', 'Female')
+    ).properties(
+        width=250,
+        height=25
+    )
+
+    area_chart = base_evol.mark_area().encode(
+        x=alt.X("annais:T", title=None),
+        y=alt.Y("nombre:Q", title=None, scale=alt.Scale(zero=False)),
+        color=alt.Color('gender:N').scale(area_color_scale)
+    )
+
+    vertical_bar = base_evol.mark_rule(
+        color='red',
+        size=2
+    ).encode(
+        x='annais:T'
+    ).add_selection(
+        select_year
+    ).transform_filter(
+        select_year
+    )
+
+    layered_chart = unpack_pyramid_data(alt.layer(area_chart, vertical_bar, data=subset), min_year)
+
+    final_evol = layered_chart.facet(
+        row=alt.Row("preusuel:O", title=None, header=None),
+        spacing=0,
+    ).properties(
+        title='Evolution'
+    ).resolve_scale(
+        y='independent'
+    )
+
+    combined_chart = alt.concat(left, middle, right, spacing=5)
+
+    final_chart = combined_chart.resolve_scale(
+        x='shared'
+    )
+
+    return (final_chart | final_evol).configure_title(
+        fontSize=20
+    ).configure_axis(
+        labelFontSize=15,
+        titleFontSize=18
+    ).configure_legend(
+        labelFontSize=15,
+        titleFontSize=18
+    ).configure_axis(
+        grid=False,
+        domain=False,
+        ticks=True,
+        labels=True
+    )
+
+# the serialized spec is cached for all the sessions of the server process (babynames.memo),
+# while the datasets it references are still in the datastore
+@memoize('queries.pyramid', normalize=lambda names, min_year=1900, max_year=2020: (names.upper(), int(min_year), int(max_year)),
+         validate=datastore.serves)
+def pyramid_spec(names, min_year=1900, max_year=2020):
+    bundled = bundle.read_spec('pyramid', f'{min_year}-{max_year}', names.upper())
+    if bundled is not None:
+        return bundled
+    with tracing.span('pyramid.chart'):
+        chart = pyramid_chart(names, min_year, max_year)
+    with tracing.span('pyramid.serialize'):
+        spec = json.dumps(chart.to_dict())
+        tracing.note_bytes(len(spec))
+    return spec
+
+def plot_name_pyramid(names=[], min_year=1900, max_year=2020):
+    with tracing.span('pyramid.spec'):
+        spec = pyramid_spec(names, min_year, max_year)
+    # a new dict for every call, the Vega pane may modify the spec it is given
+    return json.loads(spec)
+
+
+def name_table(name):
+    """Births of name per year: nationally per sex, and per department (the departments without any are left out)."""
+    cube = shared.cube()
+    years, national = cube.births_per_year(name)
+    births = cube.births_per_department_year(name)
+    present = births.any(axis=1)
+    return {
+        'name': name,
+        'first_year': int(years[0]),
+        'm': national[:, 0].tolist(),
+        'f': national[:, 1].tolist(),
+        'departments': dict(zip(cube.dpts[present].tolist(), births[present].tolist())),
+    }
+
+def top_table(year_min, year_max, levels=('department',), num_names=10):
+    """Most given names between year_min and year_max nationally, and the most given one in every unit of levels."""
+    rollups = shared.rollups()
+    return {
+        'year_min': year_min,
+        'year_max': year_max,
+        'national': get_most_common_names(year_min, year_max, num_names),
+        'units': {level: rollups.top_names(year_min, year_max, 1, level) for level in levels},
+    }
+
+def _init_batch(bundle_dir):
+    # the datasets are written to the bundle instead of being kept in memory
+    datastore.STORE = datastore.DataStore(BATCH_STORE_BYTES, os.path.join(bundle_dir, datastore.DATASTORE_ROUTE), read_dirs=[])
+    alt.data_transformers.enable('datastore')
+
+def batch_spec(chart):
+    # the charts only differ by their data from one name to the next, validating the spec against the
+    # Vega-Lite schema (most of the time of to_dict) is left to the apps
+    return json.dumps(chart.to_dict(validate=False))
+
+def render_name(bundle_dir, name, ranges, levels):
+    """Write the specs and the table of one name to the bundle, returns (name, bytes written)."""
+    cube = shared.cube()
+    written = 0
+    for level in levels:
+        for min_year, max_year in ranges:
+            chart, valid = plot_name_all_years(name, min_year, max_year, level)
+            if valid:
+                path = bundle.spec_path(bundle_dir, *map_bundle_key(name, min_year, max_year, False, level))
+                written += bundle.write_text(path, batch_spec(chart))
+        chart, valid = plot_name_years(name, cube.first_year, cube.last_year, level)
+        if valid:
+            path = bundle.spec_path(bundle_dir, *map_bundle_key(name, cube.first_year, cube.last_year, True, level))
+            written += bundle.write_text(path, batch_spec(chart))
+    path = bundle.spec_path(bundle_dir, 'pyramid', f'{cube.first_year}-{cube.last_year}', name)
+    written += bundle.write_text(path, batch_spec(pyramid_chart(name, cube.first_year, cube.last_year)))
+    written += bundle.write_json(bundle.table_path(bundle_dir, 'names', name), name_table(name))
+    return name, written
+
+def bundle_names(min_total=DEFAULT_MIN_TOTAL):
+    """Names given at least min_total times over all the years, most given first."""
+    cube = shared.cube()
+    totals = cube.name_totals(cube.first_year, cube.last_year)
+    order = np.argsort(-totals, kind='stable')
+    return cube.names[order[totals[order] >= min_total]].tolist()
+
+def build_bundle(bundle_dir, min_total=DEFAULT_MIN_TOTAL, ranges=None, levels=('department',),
+                 pyramids=(DEFAULT_PYRAMID_NAMES,), workers=None, limit=None):
+    """Render the bundle of the names given at least min_total times, returns (names, bytes written)."""
+    cube = shared.cube()
+    ranges = ranges or [(cube.first_year, cube.last_year)]
+    names = bundle_names(min_total)[:limit]
+    # a bundle is only used once its index is written, at the end
+    if os.path.exists(os.path.join(bundle_dir, bundle.INDEX_FILE)):
+        os.remove(os.path.join(bundle_dir, bundle.INDEX_FILE))
+    _init_batch(bundle_dir)
+    # loaded before the workers are forked, which then share them
+    for load in [shared.rollups, shared.top_index, shared.mix_index]:
+        load()
+
+    written = 0
+    render = functools.partial(render_name, bundle_dir, ranges=ranges, levels=levels)
+    workers = workers or os.cpu_count()
+    # a few chunks per worker: fewer round trips, and the workers finish at about the same time
+    chunksize = max(1, len(names) // (4 * workers))
+    with ProcessPoolExecutor(workers, initializer=_init_batch, initargs=(bundle_dir,)) as executor:
+        for _, size in executor.map(render, names, chunksize=chunksize):
+            written += size
+
+    full_range = f'{cube.first_year}-{cube.last_year}'
+    for names_list in pyramids:
+        path = bundle.spec_path(bundle_dir, 'pyramid', full_range, names_list.upper())
+        written += bundle.write_text(path, batch_spec(pyramid_chart(names_list, cube.first_year, cube.last_year)))
+    for min_year, max_year in ranges:
+        written += bundle.write_json(bundle.table_path(bundle_dir, 'top', f'{min_year}-{max_year}'),
+                                     top_table(min_year, max_year, levels))
+    geometry = os.path.join(bundle_dir, GEO_ROUTE, topology_file(GEOMETRY_LEVEL))
+    os.makedirs(os.path.dirname(geometry), exist_ok=True)
+    shutil.copyfile(ensure_topology(GEOMETRY_LEVEL), geometry)
+    shutil.copyfile(bundle.VIEWER_PATH, os.path.join(bundle_dir, 'index.html'))
+    written += bundle.write_json(os.path.join(bundle_dir, bundle.INDEX_FILE), {
+        'sha1': source_sha1(),
+        'first_year': cube.first_year,
+        'last_year': cube.last_year,
+        'min_total': min_total,
+        'ranges': [f'{min_year}-{max_year}' for min_year, max_year in ranges],
+        'levels': list(levels),
+        'names': {name: bundle.file_name(name) for name in names},
+        'pyramids': {names_list: bundle.file_name(names_list.upper()) for names_list in pyramids},
+    })
+    return names, written
+
+def parse_range(text):
+    min_year, _, max_year = text.partition('-')
+    return int(min_year), int(max_year)
+
+def main():
+    parser = argparse.ArgumentParser(description='Render the charts and tables of the popular names into a static bundle.')
+    parser.add_argument('bundle_dir')
+    parser.add_argument('--min-total', type=int, default=DEFAULT_MIN_TOTAL,
+                        help=f'births over all the years for a name to be rendered (default {DEFAULT_MIN_TOTAL})')
+    parser.add_argument('--ranges', nargs='+', type=parse_range, metavar='MIN-MAX',
+                        help='year ranges of the maps, all the years by default')
+    parser.add_argument('--levels', nargs='+', default=['department'], choices=LEVELS)
+    parser.add_argument('--pyramids', nargs='*', default=[DEFAULT_PYRAMID_NAMES], metavar='NAMES',
+                        help='comma-separated names of the pyramids rendered besides the one of every name')
+    parser.add_argument('--workers', type=int, help='processes, one per core by default')
+    parser.add_argument('--limit', type=int, help='only render the LIMIT most given names')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    names, written = build_bundle(args.bundle_dir, args.min_total, args.ranges, args.levels, args.pyramids,
+                                  args.workers, args.limit)
+    print(f'{len(names)} names, {written / 2 ** 20:.1f} MB of specs and tables in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
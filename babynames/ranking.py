@@ -0,0 +1,130 @@
+# Ranking of names inside every department for a year range, in one pass.
+#
+# The sparse cube rows are summed per (name, dpt) pair with a single bincount,
+# then sorted by (dpt, births desc, name) with a lexsort. Ranks are derived
+# from the group boundaries of that order without any Python loop.
+import numpy as np
+
+from babynames.data import CSV_PATH, load_derived
+
+RANK_METHODS = ['competition', 'dense', 'ordinal']
+
+
+def ranking_arrays(pairs, years, counts, n_units):
+    """Ranking arrays of rows sorted by pair = name * n_units + unit."""
+    # the rows of one (name, unit) pair are contiguous
+    new_pair = np.diff(pairs, prepend=-1) != 0
+    starts = np.flatnonzero(new_pair)
+    return {
+        'row_year': years.astype(np.int16),
+        'row_pair': (np.cumsum(new_pair) - 1).astype(np.int32),
+        'pair_name': (pairs[starts] // n_units).astype(np.int32),
+        'pair_dpt': (pairs[starts] % n_units).astype(np.int32),
+        'row_count': counts.astype(np.uint32),
+    }
+
+
+def build_ranking_arrays(cube):
+    n_years = len(cube.years)
+    cells = cube.keys // n_years
+    # rows are sorted by key, so by (name, dpt) pair
+    return ranking_arrays(cells // 2, cube.keys - cells * n_years, np.diff(cube.cumulative), len(cube.dpts))
+
+
+class RankingEngine:
+    """Per-department top names and ranks computed on top of a NameCube.
+
+    The same arrays built over coarser units (babynames.regions) rank the
+    names per region: units are then the labels of those units.
+    """
+
+    def __init__(self, cube, arrays=None, units=None):
+        self.cube = cube
+        self.units = cube.dpts if units is None else units
+        arrays = build_ranking_arrays(cube) if arrays is None else arrays
+        self.row_year = arrays['row_year']
+        self.row_pair = arrays['row_pair']
+        self.pair_name = arrays['pair_name']
+        self.pair_dpt = arrays['pair_dpt']
+        self.row_count = arrays['row_count']
+
+    @classmethod
+    def load(cls, cube, csv_path=CSV_PATH):
+        return cls(cube, load_derived('ranking', lambda columns: build_ranking_arrays(cube), csv_path))
+
+    def pair_totals(self, year_min, year_max):
+        """Births of every (name, dpt) pair between year_min and year_max, aligned with pair_name/pair_dpt."""
+        lo, hi = self.cube.year_span(year_min, year_max)
+        mask = (self.row_year >= lo) & (self.row_year < hi)
+        totals = np.bincount(self.row_pair[mask], weights=self.row_count[mask], minlength=len(self.pair_name))
+        return totals.astype(np.int64)
+
+    def rank(self, year_min, year_max, method='competition'):
+        if method not in RANK_METHODS:
+            raise ValueError(f'unknown rank method {method!r}, expected one of {RANK_METHODS}')
+        totals = self.pair_totals(year_min, year_max)
+        present = np.flatnonzero(totals)
+        order = present[np.lexsort((self.pair_name[present], -totals[present], self.pair_dpt[present]))]
+        dpt = self.pair_dpt[order]
+        total = totals[order]
+
+        index = np.arange(len(order))
+        new_group = np.ones(len(order), dtype=bool)
+        new_group[1:] = dpt[1:] != dpt[:-1]
+        new_value = new_group.copy()
+        new_value[1:] |= total[1:] != total[:-1]
+        group_start = np.maximum.accumulate(np.where(new_group, index, 0))
+
+        if method == 'ordinal':
+            ranks = index - group_start + 1
+        elif method == 'competition':
+            ranks = np.maximum.accumulate(np.where(new_value, index, 0)) - group_start + 1
+        else:
+            distinct = np.cumsum(new_value)
+            ranks = distinct - distinct[group_start] + 1
+        return DepartmentRanks(self.cube, self.pair_name[order], dpt, total, ranks, index - group_start, self.units)
+
+
+class DepartmentRanks:
+    """Names of every department sorted by births, with their ranks.
+
+    All arrays are sorted by (dpt, births desc, name); position is the
+    0-based place of the row inside its department. dpt indexes units, the
+    departments of the cube unless the ranking is over regions.
+    """
+
+    def __init__(self, cube, name, dpt, total, rank, position, units=None):
+        self.cube = cube
+        self.units = cube.dpts if units is None else units
+        self.name = name
+        self.dpt = dpt
+        self.total = total
+        self.rank = rank
+        self.position = position
+
+    def top(self, num_names=1):
+        """Dict dpt code -> list of the num_names most given names, for every department of the cube."""
+        keep = self.position < num_names
+        names = self.cube.names[self.name[keep]]
+        bounds = np.searchsorted(self.dpt[keep], np.arange(len(self.units) + 1))
+        return {dpt: names[bounds[i]:bounds[i + 1]].tolist() for i, dpt in enumerate(self.units.tolist())}
+
+    def ranks_of(self, names):
+        """Array (len(names), n_dpts) of the ranks of names, -1 where the name has no birth."""
+        codes = np.array([self.cube.name_code(name) for name in names], dtype=np.int64)
+        ranks = np.full((len(codes), len(self.units)), -1, dtype=np.int64)
+        known = codes >= 0
+        unique_codes, inverse = np.unique(codes[known], return_inverse=True)
+        # map each row's name code to its line in unique_codes, -1 for names not asked for
+        lookup = np.full(len(self.cube.names), -1, dtype=np.int64)
+        lookup[unique_codes] = np.arange(len(unique_codes))
+        target = lookup[self.name]
+        hit = target >= 0
+        unique_ranks = np.full((len(unique_codes), len(self.units)), -1, dtype=np.int64)
+        unique_ranks[target[hit], self.dpt[hit]] = self.rank[hit]
+        ranks[known] = unique_ranks[inverse]
+        return ranks
+
+    def rank_of(self, name):
+        """Dict dpt code -> rank of name, -1 where the name has no birth."""
+        return dict(zip(self.units.tolist(), self.ranks_of([name])[0].tolist()))
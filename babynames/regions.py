@@ -0,0 +1,178 @@
+# Department -> region -> nation rollups of the name cube.
+#
+# Departments are grouped into the regions of 2016 (region), the regions of
+# 1982-2015 (old_region) or the whole country (nation). For each of these
+# levels the cube rows are summed once into sparse rows sorted by
+# (name, unit, year) with a running total, like the cube keys, together with
+# the arrays of a RankingEngine over the units of the level. Any level then
+# answers births, ranks and top names over a year range without going back to
+# the department rows.
+import numpy as np
+
+from babynames.data import CSV_PATH, load_derived
+from babynames.ranking import RankingEngine, ranking_arrays
+
+REGIONS = {
+    'Auvergne-Rhône-Alpes': ['01', '03', '07', '15', '26', '38', '42', '43', '63', '69', '73', '74'],
+    'Bourgogne-Franche-Comté': ['21', '25', '39', '58', '70', '71', '89', '90'],
+    'Bretagne': ['22', '29', '35', '56'],
+    'Centre-Val de Loire': ['18', '28', '36', '37', '41', '45'],
+    'Corse': ['2A', '2B'],
+    'Grand Est': ['08', '10', '51', '52', '54', '55', '57', '67', '68', '88'],
+    'Hauts-de-France': ['02', '59', '60', '62', '80'],
+    'Île-de-France': ['75', '77', '78', '91', '92', '93', '94', '95'],
+    'Normandie': ['14', '27', '50', '61', '76'],
+    'Nouvelle-Aquitaine': ['16', '17', '19', '23', '24', '33', '40', '47', '64', '79', '86', '87'],
+    'Occitanie': ['09', '11', '12', '30', '31', '32', '34', '46', '48', '65', '66', '81', '82'],
+    'Pays de la Loire': ['44', '49', '53', '72', '85'],
+    "Provence-Alpes-Côte d'Azur": ['04', '05', '06', '13', '83', '84'],
+    'Guadeloupe': ['971'],
+    'Martinique': ['972'],
+    'Guyane': ['973'],
+    'La Réunion': ['974'],
+    'Mayotte': ['976'],
+}
+
+OLD_REGIONS = {
+    'Alsace': ['67', '68'],
+    'Aquitaine': ['24', '33', '40', '47', '64'],
+    'Auvergne': ['03', '15', '43', '63'],
+    'Basse-Normandie': ['14', '50', '61'],
+    'Bourgogne': ['21', '58', '71', '89'],
+    'Bretagne': ['22', '29', '35', '56'],
+    'Centre': ['18', '28', '36', '37', '41', '45'],
+    'Champagne-Ardenne': ['08', '10', '51', '52'],
+    'Corse': ['2A', '2B'],
+    'Franche-Comté': ['25', '39', '70', '90'],
+    'Haute-Normandie': ['27', '76'],
+    'Île-de-France': ['75', '77', '78', '91', '92', '93', '94', '95'],
+    'Languedoc-Roussillon': ['11', '30', '34', '48', '66'],
+    'Limousin': ['19', '23', '87'],
+    'Lorraine': ['54', '55', '57', '88'],
+    'Midi-Pyrénées': ['09', '12', '31', '32', '46', '65', '81', '82'],
+    'Nord-Pas-de-Calais': ['59', '62'],
+    'Pays de la Loire': ['44', '49', '53', '72', '85'],
+    'Picardie': ['02', '60', '80'],
+    'Poitou-Charentes': ['16', '17', '79', '86'],
+    "Provence-Alpes-Côte d'Azur": ['04', '05', '06', '13', '83', '84'],
+    'Rhône-Alpes': ['01', '07', '26', '38', '42', '69', '73', '74'],
+    'Guadeloupe': ['971'],
+    'Martinique': ['972'],
+    'Guyane': ['973'],
+    'La Réunion': ['974'],
+    'Mayotte': ['976'],
+}
+
+NATION = 'France'
+LEVELS = ['department', 'region', 'old_region', 'nation']
+ROLLUP_LEVELS = LEVELS[1:]
+
+
+def level_units(dpts, level):
+    """Labels of the units of a rollup level and the unit of every department (-1 if it has none)."""
+    if level == 'nation':
+        return np.array([NATION]), np.zeros(len(dpts), dtype=np.int64)
+    groups = {'region': REGIONS, 'old_region': OLD_REGIONS}[level]
+    units = np.array(list(groups))
+    unit_of = {dpt: i for i, members in enumerate(groups.values()) for dpt in members}
+    return units, np.array([unit_of.get(dpt, -1) for dpt in dpts.tolist()], dtype=np.int64)
+
+
+def build_rollup_arrays(cube):
+    n_years, n_dpts = len(cube.years), len(cube.dpts)
+    cells = cube.keys // n_years
+    year = cube.keys - cells * n_years
+    name, dpt = np.divmod(cells // 2, n_dpts)
+    counts = np.diff(cube.cumulative)
+
+    arrays = {}
+    for level in ROLLUP_LEVELS:
+        units, dpt_unit = level_units(cube.dpts, level)
+        unit = dpt_unit[dpt]
+        known = unit >= 0
+        pairs = name[known] * len(units) + unit[known]
+        # one row per (name, unit, year), sorted
+        keys, inverse = np.unique(pairs * n_years + year[known], return_inverse=True)
+        totals = np.bincount(inverse, weights=counts[known]).astype(np.int64)
+        cumulative = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(totals, out=cumulative[1:])
+        arrays[f'{level}.keys'] = keys
+        arrays[f'{level}.cumulative'] = cumulative
+        for key, array in ranking_arrays(keys // n_years, keys % n_years, totals, len(units)).items():
+            arrays[f'{level}.{key}'] = array
+    return arrays
+
+
+class RegionRollups:
+    """Births, ranks and top names of names at every level of LEVELS."""
+
+    def __init__(self, cube, arrays, ranking=None):
+        self.cube = cube
+        self.units = {'department': cube.dpts}
+        self.dpt_units = {'department': np.arange(len(cube.dpts))}
+        self.keys = {}
+        self.cumulative = {}
+        self.engines = {'department': RankingEngine(cube) if ranking is None else ranking}
+        for level in ROLLUP_LEVELS:
+            self.units[level], self.dpt_units[level] = level_units(cube.dpts, level)
+            self.keys[level] = arrays[f'{level}.keys']
+            self.cumulative[level] = arrays[f'{level}.cumulative']
+            engine_arrays = {key: arrays[f'{level}.{key}']
+                             for key in ['row_year', 'row_pair', 'pair_name', 'pair_dpt', 'row_count']}
+            self.engines[level] = RankingEngine(cube, engine_arrays, self.units[level])
+
+    @classmethod
+    def load(cls, cube, ranking=None, csv_path=CSV_PATH):
+        return cls(cube, load_derived('rollups', lambda columns: build_rollup_arrays(cube), csv_path), ranking)
+
+    @staticmethod
+    def _check_level(level):
+        if level not in LEVELS:
+            raise ValueError(f'unknown level {level!r}, expected one of {LEVELS}')
+
+    def department_units(self, level):
+        """Label of the unit of every department (aligned with cube.dpts), None where it has none."""
+        self._check_level(level)
+        units, dpt_unit = self.units[level], self.dpt_units[level]
+        return [units[i] if i >= 0 else None for i in dpt_unit.tolist()]
+
+    def births_per_unit(self, name, year_min, year_max, level='region'):
+        """Births of name in every unit of the level (aligned with self.units[level]) between year_min and year_max."""
+        self._check_level(level)
+        if level == 'department':
+            return self.cube.births_per_department(name, year_min, year_max)
+        n_units, n_years = len(self.units[level]), len(self.cube.years)
+        code = self.cube.name_code(name)
+        if code < 0:
+            return np.zeros(n_units, dtype=np.int64)
+        lo, hi = self.cube.year_span(year_min, year_max)
+        cells = code * n_units + np.arange(n_units)
+        start = np.searchsorted(self.keys[level], cells * n_years + lo)
+        stop = np.searchsorted(self.keys[level], cells * n_years + hi)
+        return self.cumulative[level][stop] - self.cumulative[level][start]
+
+    def births_per_unit_year(self, name, level='region'):
+        """Births of name per unit of the level and year (aligned with cube.years)."""
+        self._check_level(level)
+        if level == 'department':
+            return self.cube.births_per_department_year(name)
+        n_units, n_years = len(self.units[level]), len(self.cube.years)
+        births = np.zeros((n_units, n_years), dtype=np.int64)
+        code = self.cube.name_code(name)
+        if code < 0:
+            return births
+        # the rows of one name are a contiguous slice of the sorted keys, one per (unit, year)
+        first = code * n_units * n_years
+        start, stop = np.searchsorted(self.keys[level], [first, first + n_units * n_years])
+        unit, year = np.divmod(self.keys[level][start:stop] - first, n_years)
+        births[unit, year] = np.diff(self.cumulative[level][start:stop + 1])
+        return births
+
+    def rank(self, year_min, year_max, level='region', method='competition'):
+        """Ranks of the names inside every unit of the level, see RankingEngine.rank."""
+        self._check_level(level)
+        return self.engines[level].rank(year_min, year_max, method)
+
+    def top_names(self, year_min, year_max, num_names=10, level='region'):
+        """Dict unit label -> its num_names most given names between year_min and year_max."""
+        return self.rank(year_min, year_max, level).top(num_names)
@@ -0,0 +1,66 @@
+# Substring search over the ~30k distinct names, ignoring case and accents.
+#
+# Names are folded once (FRÉDÉRIQUE -> FREDERIQUE). Prefix matches come from
+# bisect on the sorted folded names, other substring matches from an index of
+# the 1, 2 and 3 letter grams of every name: the posting lists of the query
+# grams are intersected and the few remaining candidates checked with `in`.
+# When the new query contains the previous one (the user typed one more
+# letter), only the previous results are filtered.
+import unicodedata
+from bisect import bisect_left
+
+GRAM_SIZES = [1, 2, 3]
+
+
+def fold(text):
+    """Upper case text without accents: 'Frédérique' -> 'FREDERIQUE'."""
+    decomposed = unicodedata.normalize('NFKD', text.upper())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class NameSearchIndex:
+    def __init__(self, names):
+        self.names = [str(name) for name in names]
+        self.folded = [fold(name) for name in self.names]
+        self.prefix_order = sorted(range(len(self.names)), key=lambda i: (self.folded[i], i))
+        self.prefix_keys = [self.folded[i] for i in self.prefix_order]
+
+        postings = {}
+        for i, name in enumerate(self.folded):
+            for size in GRAM_SIZES:
+                for gram in grams(name, size):
+                    postings.setdefault(gram, []).append(i)
+        self.postings = postings
+        self._last_query = None
+        self._last_matches = None
+
+    def _prefix_matches(self, query):
+        start = bisect_left(self.prefix_keys, query)
+        stop = bisect_left(self.prefix_keys, query + '\uffff', start)
+        return self.prefix_order[start:stop]
+
+    def _substring_matches(self, query):
+        if self._last_query is not None and self._last_query in query:
+            # results can only shrink when the query grows
+            candidates = self._last_matches
+        else:
+            size = min(len(query), GRAM_SIZES[-1])
+            lists = sorted((self.postings.get(gram, []) for gram in grams(query, size)), key=len)
+            candidates = set(lists[0]).intersection(*lists[1:])
+        return sorted(i for i in candidates if query in self.folded[i])
+
+    def search(self, query):
+        """Names containing query, the ones starting with it first, then in the order given to the index."""
+        query = fold(query)
+        if not query:
+            self._last_query = None
+            return list(self.names)
+        matches = self._substring_matches(query)
+        self._last_query, self._last_matches = query, matches
+        prefix = self._prefix_matches(query)
+        is_prefix = set(prefix)
+        return [self.names[i] for i in prefix] + [self.names[i] for i in matches if i not in is_prefix]
@@ -0,0 +1,74 @@
+# Data shared by every session of a panel server process.
+#
+# panel serve runs the app script again for each browser session, but
+# imported modules are loaded once per process: the apps get their data from
+# the functions below, which build it on the first call only. The server can
+# build everything before the first visitor with a setup script:
+# panel serve app.py --setup ../babynames/warm.py
+import functools
+import threading
+import time
+
+from babynames import geo
+from babynames.cube import NameCube
+from babynames.mix import GenderMixIndex
+from babynames.ranking import RankingEngine
+from babynames.regions import RegionRollups
+from babynames.topk import TopKIndex
+
+_lock = threading.RLock()
+# name of each loaded object -> seconds it took to build
+LOAD_TIMES = {}
+
+
+def process_cached(function):
+    """Call function once per process, sessions opened meanwhile wait for the result."""
+    result = []
+
+    @functools.wraps(function)
+    def wrapper():
+        if not result:
+            with _lock:
+                if not result:
+                    start = time.perf_counter()
+                    result.append(function())
+                    LOAD_TIMES[function.__name__] = time.perf_counter() - start
+        return result[0]
+    return wrapper
+
+
+@process_cached
+def cube():
+    return NameCube.load()
+
+
+@process_cached
+def ranking():
+    return RankingEngine.load(cube())
+
+
+@process_cached
+def rollups():
+    return RegionRollups.load(cube(), ranking())
+
+
+@process_cached
+def top_index():
+    return TopKIndex.load(cube())
+
+
+@process_cached
+def mix_index():
+    return GenderMixIndex.load(cube())
+
+
+@process_cached
+def department_names():
+    """Department code -> name."""
+    return geo.department_names()
+
+
+def warm():
+    for load in [cube, ranking, rollups, top_index, mix_index, department_names]:
+        load()
+    return dict(LOAD_TIMES)
@@ -0,0 +1,129 @@
+# "Names like this one": names whose popularity curve over the years has the
+# same shape, and names which sound the same.
+#
+# The popularity of a name in a year is its share of the births of that year.
+# Each curve is centred and scaled to unit length, so the dot product of two
+# curves is their correlation and the most similar names of one name are a
+# single matrix-vector product over all the names (BLAS), followed by a
+# partial sort. The approximate mode scores the names on the first components
+# of an SVD of the curves instead, then ranks a few times more candidates than
+# asked with the exact curves.
+#
+# Spelling variants (CAMILLE / KAMILLE, FRÉDÉRIQUE / FREDERIQUE / FRÉDÉRIC)
+# share a French phonetic key; the names are stored sorted by key so that the
+# variants of a name are one searchsorted away.
+import re
+
+import numpy as np
+
+from babynames.data import CSV_PATH, load_derived
+from babynames.search import fold
+
+MIN_TOTAL = 500
+COMPONENTS = 16
+OVERSAMPLING = 4
+
+# applied in order to the folded name, see phonetic_key
+PHONETIC_RULES = [(re.compile(pattern), replacement) for pattern, replacement in [
+    (r'[^A-Z]', ''),
+    (r'PH', 'F'),
+    (r'TH', 'T'),
+    (r'GH', 'G'),
+    (r'QU?', 'K'),
+    (r'CK', 'K'),
+    (r'CH(?=[LR])', 'K'),
+    (r'C(?=[EIY])', 'S'),
+    (r'C(?!H)', 'K'),
+    (r'G(?=[EIY])', 'J'),
+    (r'GU(?=[EIY])', 'G'),
+    (r'X', 'KS'),
+    (r'Y', 'I'),
+    (r'W', 'V'),
+    (r'Z', 'S'),
+    (r'E?AU', 'O'),
+    (r'[AE]I', 'E'),
+    (r'EN(?![AEIOUN])', 'AN'),
+    (r'(?<![CS])H', ''),
+    (r'[DSTX]$', ''),
+    (r'(?<=.)E$', ''),
+    (r'(.)\1+', r'\1'),
+]]
+
+
+def phonetic_key(name):
+    """Key shared by the names pronounced alike: 'Camille', 'KAMILLE' -> 'KAMIL'."""
+    key = fold(name)
+    for pattern, replacement in PHONETIC_RULES:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def build_similarity_arrays(cube):
+    births = cube.name_year_matrix().astype(np.float64)
+    year_totals = births.sum(axis=0)
+    shares = np.divide(births, year_totals, out=np.zeros_like(births), where=year_totals > 0)
+    curves = shares - shares.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(curves, axis=1, keepdims=True)
+    curves = np.divide(curves, norms, out=np.zeros_like(curves), where=norms > 0).astype(np.float32)
+    _, _, components = np.linalg.svd(curves, full_matrices=False)
+
+    keys = np.array([phonetic_key(name) for name in cube.names.tolist()])
+    order = np.argsort(keys, kind='stable')
+    return {
+        'curves': curves,
+        'reduced': curves @ components[:COMPONENTS].T,
+        'totals': births.sum(axis=1).astype(np.int64),
+        'phonetic_keys': keys[order],
+        'phonetic_order': order.astype(np.int32),
+    }
+
+
+class SimilarityIndex:
+    """Names with a similar popularity curve or a similar sound."""
+
+    def __init__(self, cube, arrays):
+        self.cube = cube
+        self.curves = arrays['curves']
+        self.reduced = arrays['reduced']
+        self.totals = arrays['totals']
+        self.phonetic_keys = arrays['phonetic_keys']
+        self.phonetic_order = arrays['phonetic_order']
+
+    @classmethod
+    def load(cls, cube, csv_path=CSV_PATH):
+        return cls(cube, load_derived('similarity', lambda columns: build_similarity_arrays(cube), csv_path))
+
+    @staticmethod
+    def _best(candidates, scores, num_names):
+        if num_names < len(candidates):
+            keep = np.argpartition(-scores, num_names)[:num_names]
+            candidates, scores = candidates[keep], scores[keep]
+        order = np.lexsort((candidates, -scores))
+        return candidates[order], scores[order]
+
+    def similar(self, name, num_names=10, min_total=MIN_TOTAL, approximate=False):
+        """(names, correlations) of the num_names curves closest to the one of name, closest first.
+
+        Only names given at least min_total times are candidates, the rare
+        ones have noisy curves.
+        """
+        code = self.cube.name_code(name)
+        if code < 0:
+            return [], np.zeros(0, dtype=np.float32)
+        candidates = np.flatnonzero(self.totals >= min_total)
+        candidates = candidates[candidates != code]
+        if approximate and num_names * OVERSAMPLING < len(candidates):
+            scores = self.reduced[candidates] @ self.reduced[code]
+            candidates, _ = self._best(candidates, scores, num_names * OVERSAMPLING)
+        scores = self.curves[candidates] @ self.curves[code]
+        codes, scores = self._best(candidates, scores, num_names)
+        return self.cube.names[codes].tolist(), scores
+
+    def variants(self, name):
+        """Other names with the phonetic key of name, most given first."""
+        key = phonetic_key(name)
+        start = np.searchsorted(self.phonetic_keys, key, side='left')
+        stop = np.searchsorted(self.phonetic_keys, key, side='right')
+        codes = self.phonetic_order[start:stop]
+        codes = codes[np.lexsort((codes, -self.totals[codes]))]
+        return [variant for variant in self.cube.names[codes].tolist() if variant != name.upper()]
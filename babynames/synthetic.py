@@ -0,0 +1,172 @@
+# Synthetic files shaped like the INSEE dpt2020.csv, for the benchmarks.
+#
+# The real file is not part of the repository. generate() writes one with its
+# schema (sexe;preusuel;annais;dpt;nombre) and what the loading code has to
+# deal with: births of a department and year below MIN_CELL are not published
+# and end up in one 'XXXX' year / 'XX' department row per name and sex, and the
+# names given fewer than MIN_NAME_BIRTHS times are only counted in
+# _PRENOMS_RARES rows. Name popularity follows a Zipf(-Mandelbrot) law, each name has a
+# popularity curve over the years, a sex ratio (mostly one sex, some mixed) and
+# its own spread over the departments.
+#
+# Scale 1 has about the number of names and rows of the real file (33,000
+# names, 3 million rows, 90 million births), scale 10 ten times more names with
+# the same popularity distribution, and so on. The output only depends on the
+# scale and the seed, it is written block of names by block of names so memory
+# does not grow with the scale.
+# python -m babynames.synthetic --scale 10 writes .cache/synthetic/v1/dpt2020-x10.csv
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from babynames.data import CACHE_DIR
+from babynames.geo import department_names
+
+FIRST_YEAR, LAST_YEAR = 1900, 2020
+# bump when the generated rows change: the files of an earlier version are not reused
+SYNTHETIC_VERSION = 1
+SYNTHETIC_DIR = os.path.join(CACHE_DIR, 'synthetic', f'v{SYNTHETIC_VERSION}')
+# names and births per year of scale 1
+BASE_NAMES = 36_000
+BIRTHS_PER_YEAR = 750_000
+# Zipf-Mandelbrot law: the births of the name of rank r are proportional to (r + ZIPF_OFFSET) ** -ZIPF_EXPONENT,
+# the most given name gets about 3% of the births and the last ones are rare names
+ZIPF_EXPONENT = 1.6
+ZIPF_OFFSET = 20
+# publication thresholds of the department file
+MIN_CELL = 3
+MIN_NAME_BIRTHS = 20
+RARE_NAMES = '_PRENOMS_RARES'
+# the first names of the first replica, so that the defaults of the apps find births
+KNOWN_NAMES = ['MARIE', 'JEAN', 'CAMILLE', 'DOMINIQUE', 'CLAUDE', 'PASCAL', 'PASCALE', 'FRÉDÉRIQUE',
+               'CHARLIE', 'ANDRÉ', 'LÉA', 'THÉO', 'KAMILLE', 'FREDERIQUE', 'ANDREA', 'LEA']
+# two letters each: a sequence of syllables can only be read one way, so generated names are distinct
+SYLLABLES = [consonant + vowel for consonant in 'BDFGJLMNPRSTVZ' for vowel in 'AEIOU'] + ['LÉ', 'MÉ', 'RÉ', 'TÉ']
+BLOCK_NAMES = 256
+
+
+def synthetic_path(scale=1, seed=0):
+    suffix = f'-s{seed}' if seed else ''
+    return os.path.join(SYNTHETIC_DIR, f'dpt2020-x{scale:g}{suffix}.csv')
+
+
+def synthetic_name(index):
+    """Name number index: the known names, then words of two syllables or more (bijective base len(SYLLABLES))."""
+    if index < len(KNOWN_NAMES):
+        return KNOWN_NAMES[index]
+    number = index - len(KNOWN_NAMES) + len(SYLLABLES) + 1
+    syllables = []
+    while number > 0:
+        number, digit = divmod(number - 1, len(SYLLABLES))
+        syllables.append(SYLLABLES[digit])
+    return ''.join(reversed(syllables))
+
+
+def name_block(rng, ranks, dpt_weights, years):
+    """Births of a block of names as an int64 (names, sexes, years, departments) array."""
+    popularity = (ranks + 1.0 + ZIPF_OFFSET) ** -ZIPF_EXPONENT
+    popularity /= np.sum((np.arange(1, BASE_NAMES + 1, dtype=np.float64) + ZIPF_OFFSET) ** -ZIPF_EXPONENT)
+    total = popularity * BIRTHS_PER_YEAR * len(years)
+    # a bell curve over the years, some names peak before or after the period of the file;
+    # the rarest names are fashionable for a few years only
+    peaks = rng.uniform(FIRST_YEAR - 30, LAST_YEAR + 30, len(ranks))
+    widths = rng.lognormal(np.log(25), 0.5, len(ranks)) * np.clip(total / 20_000, 0.1, 1)
+    curves = np.exp(-(((years - peaks[:, None]) / widths[:, None]) ** 2))
+    curves /= np.maximum(curves.sum(axis=1, keepdims=True), 1e-12)
+    expected = total[:, None] * curves
+    # most names are given to one sex, a few to both
+    male_share = rng.beta(0.2, 0.2, len(ranks))
+    expected = expected[:, None, :] * np.stack([male_share, 1 - male_share], axis=1)[:, :, None]
+    national = rng.poisson(expected)
+    # every name favours some departments, the rarest ones are given in a few departments only
+    concentration = np.clip(total / 20_000, 0.05, 2)
+    spread = dpt_weights * rng.gamma(concentration[:, None], 1.0, (len(ranks), len(dpt_weights)))
+    spread /= spread.sum(axis=1, keepdims=True)
+    return rng.multinomial(national, spread[:, None, None, :])
+
+
+def block_rows(births, names, years, dpts, rare):
+    """Published rows of a block as a frame; the births of rare names are added to rare instead."""
+    totals = births.sum(axis=(1, 2, 3))
+    is_rare = totals < MIN_NAME_BIRTHS
+    rare += births[is_rare].sum(axis=0)
+    births = births[~is_rare]
+    names = names[~is_rare]
+    # births of the cells below the threshold only appear in one row per name and sex
+    small = np.where(births < MIN_CELL, births, 0).sum(axis=(2, 3))
+    name_index, sex_index, year_index, dpt_index = np.nonzero(births >= MIN_CELL)
+    published = pd.DataFrame({
+        'sexe': sex_index + 1,
+        'preusuel': names[name_index],
+        'annais': years[year_index].astype(str),
+        'dpt': dpts[dpt_index],
+        'nombre': births[name_index, sex_index, year_index, dpt_index],
+    })
+    name_index, sex_index = np.nonzero(small)
+    unknown = pd.DataFrame({'sexe': sex_index + 1, 'preusuel': names[name_index], 'annais': 'XXXX', 'dpt': 'XX',
+                            'nombre': small[name_index, sex_index]})
+    return pd.concat([published, unknown], ignore_index=True)
+
+
+def rare_rows(rare, years, dpts):
+    sex_index, year_index, dpt_index = np.nonzero(rare)
+    return pd.DataFrame({'sexe': sex_index + 1, 'preusuel': RARE_NAMES, 'annais': years[year_index].astype(str),
+                         'dpt': dpts[dpt_index], 'nombre': rare[sex_index, year_index, dpt_index]})
+
+
+def generate(path=None, scale=1, seed=0):
+    """Write the synthetic file of scale and seed to path, returns (path, rows written)."""
+    path = path or synthetic_path(scale, seed)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    years = np.arange(FIRST_YEAR, LAST_YEAR + 1)
+    dpts = np.array(sorted(department_names()))
+    # department populations, the same at every scale
+    dpt_weights = np.random.default_rng([seed]).dirichlet(np.full(len(dpts), 2.0))
+    rare = np.zeros((2, len(years), len(dpts)), dtype=np.int64)
+    n_names = int(round(BASE_NAMES * scale))
+    rows = 0
+    # written next to the target and renamed, an interrupted run leaves no partial file behind
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w', encoding='utf-8', newline='') as f:
+        f.write('sexe;preusuel;annais;dpt;nombre\n')
+        for start in range(0, n_names, BLOCK_NAMES):
+            # one generator per block: the rows of a name do not depend on the block size of other runs
+            rng = np.random.default_rng([seed, start])
+            indexes = np.arange(start, min(start + BLOCK_NAMES, n_names))
+            names = np.array([synthetic_name(index) for index in indexes], dtype=object)
+            # scale s repeats the popularity ranks of scale 1 s times with other names
+            births = name_block(rng, indexes % BASE_NAMES, dpt_weights, years)
+            frame = block_rows(births, names, years, dpts, rare)
+            frame.to_csv(f, sep=';', header=False, index=False)
+            rows += len(frame)
+        frame = rare_rows(rare, years, dpts)
+        frame.to_csv(f, sep=';', header=False, index=False)
+        rows += len(frame)
+    os.replace(tmp, path)
+    return path, rows
+
+
+def ensure_synthetic(scale=1, seed=0):
+    """Path of the synthetic file of scale and seed, generated if missing."""
+    path = synthetic_path(scale, seed)
+    if not os.path.exists(path):
+        generate(path, scale, seed)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic file shaped like dpt2020.csv.')
+    parser.add_argument('path', nargs='?', help='output file, .cache/synthetic/v<version>/dpt2020-x<scale>.csv by default')
+    parser.add_argument('--scale', type=float, default=1, help='names relative to the real file (default 1)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    path, rows = generate(args.path, args.scale, args.seed)
+    print(f'{path}: {rows} rows, {os.path.getsize(path) / 2 ** 20:.1f} MB in {time.perf_counter() - start:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
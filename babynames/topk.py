@@ -0,0 +1,161 @@
+# Precomputed index answering "most given names between year A and year B",
+# nationally or in one department.
+#
+# For every scope (the nation, then each department) and every year, and for
+# blocks of BLOCK_YEARS consecutive years, the LIST_SIZE most given names are
+# stored together with a bound: the births of the best name left out of the
+# list. A year interval is split into whole blocks plus the remaining years.
+# The union of their lists gives the candidates, whose exact totals come from
+# the cube prefix sums. No name outside the candidates can have more births
+# than the sum of the bounds, so when the k-th candidate beats that sum the
+# answer is exact; otherwise every name of the scope is summed (still exact,
+# just slower).
+import numpy as np
+
+from babynames.data import CSV_PATH, load_derived
+
+BLOCK_YEARS = 8
+LIST_SIZE = 64
+
+
+def top_lists(scope, unit, name, count, n_scopes, n_units, size=LIST_SIZE):
+    """Top names per (scope, unit) from rows with unique (scope, unit, name).
+
+    Returns names (n_scopes, n_units, size) padded with -1 and the bound
+    (n_scopes, n_units): births of the best name not in the list, 0 if none.
+    """
+    order = np.lexsort((name, -count, unit, scope))
+    group = scope[order].astype(np.int64) * n_units + unit[order]
+    index = np.arange(len(order))
+    new_group = np.ones(len(order), dtype=bool)
+    new_group[1:] = group[1:] != group[:-1]
+    position = index - np.maximum.accumulate(np.where(new_group, index, 0))
+
+    names = np.full((n_scopes * n_units, size), -1, dtype=np.int32)
+    kept = position < size
+    names[group[kept], position[kept]] = name[order][kept]
+    bound = np.zeros(n_scopes * n_units, dtype=np.int64)
+    first_out = position == size
+    bound[group[first_out]] = count[order][first_out]
+    return names.reshape(n_scopes, n_units, size), bound.reshape(n_scopes, n_units)
+
+
+def _aggregate(key, count):
+    unique_keys, inverse = np.unique(key, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=count).astype(np.int64)
+
+
+def build_topk_arrays(cube):
+    n_names, n_dpts, n_years = len(cube.names), len(cube.dpts), len(cube.years)
+    n_scopes = n_dpts + 1
+    n_blocks = -(-n_years // BLOCK_YEARS)
+
+    # per-year births of every (name, dpt) summed over sexes: scope = dpt + 1
+    cells = cube.keys // n_years
+    year = cube.keys - cells * n_years
+    pairs = cells // 2
+    keys, counts = _aggregate((pairs * n_years + year), np.diff(cube.cumulative))
+    year = keys % n_years
+    name, dpt = np.divmod(keys // n_years, n_dpts)
+    scope = dpt + 1
+
+    # national births per year, scope 0
+    national = np.diff(cube.national.astype(np.int64).sum(axis=2), axis=1)
+    nat_name, nat_year = np.nonzero(national)
+    scope = np.concatenate([np.zeros(len(nat_name), dtype=np.int64), scope])
+    name = np.concatenate([nat_name, name])
+    year = np.concatenate([nat_year, year])
+    counts = np.concatenate([national[nat_name, nat_year], counts])
+
+    year_names, year_bound = top_lists(scope, year, name, counts, n_scopes, n_years)
+
+    block_keys, block_counts = _aggregate((scope * n_blocks + year // BLOCK_YEARS) * n_names + name, counts)
+    block_scope, block = np.divmod(block_keys // n_names, n_blocks)
+    block_names, block_bound = top_lists(block_scope, block, block_keys % n_names, block_counts, n_scopes, n_blocks)
+
+    # names present in each department, used when the lists cannot prove the answer
+    present = np.unique(pairs)
+    present_name, present_dpt = np.divmod(present, n_dpts)
+    order = np.argsort(present_dpt, kind='stable')
+    dpt_names_ptr = np.searchsorted(present_dpt[order], np.arange(n_dpts + 1))
+
+    return {
+        'year_names': year_names,
+        'year_bound': year_bound,
+        'block_names': block_names,
+        'block_bound': block_bound,
+        'dpt_names': present_name[order].astype(np.int32),
+        'dpt_names_ptr': dpt_names_ptr,
+    }
+
+
+class TopKIndex:
+    """Exact top-K names over any year interval, nationally or per department."""
+
+    def __init__(self, cube, arrays):
+        self.cube = cube
+        self.year_names = arrays['year_names']
+        self.year_bound = arrays['year_bound']
+        self.block_names = arrays['block_names']
+        self.block_bound = arrays['block_bound']
+        self.dpt_names = arrays['dpt_names']
+        self.dpt_names_ptr = arrays['dpt_names_ptr']
+        self.list_size = self.year_names.shape[2]
+
+    @classmethod
+    def load(cls, cube, csv_path=CSV_PATH):
+        return cls(cube, load_derived('topk', lambda columns: build_topk_arrays(cube), csv_path))
+
+    def _exact_totals(self, codes, year_min, year_max, dpt_code):
+        if dpt_code is None:
+            lo, hi = self.cube.year_span(year_min, year_max)
+            return (self.cube.national[codes, hi, :].astype(np.int64) - self.cube.national[codes, lo, :]).sum(axis=1)
+        return self.cube.range_sums(codes, np.full(len(codes), dpt_code), year_min, year_max)
+
+    def _all_codes(self, dpt_code):
+        if dpt_code is None:
+            return np.arange(len(self.cube.names))
+        return self.dpt_names[self.dpt_names_ptr[dpt_code]:self.dpt_names_ptr[dpt_code + 1]]
+
+    def _components(self, lo, hi):
+        # whole blocks inside [lo, hi) and the years left on both sides
+        first_block = -(-lo // BLOCK_YEARS)
+        last_block = hi // BLOCK_YEARS
+        if first_block >= last_block:
+            return np.arange(lo, hi), np.arange(0)
+        years = np.r_[lo:first_block * BLOCK_YEARS, last_block * BLOCK_YEARS:hi]
+        return years, np.arange(first_block, last_block)
+
+    @staticmethod
+    def _best(codes, totals, num_names):
+        keep = totals > 0
+        codes, totals = codes[keep], totals[keep]
+        order = np.lexsort((codes, -totals))[:num_names]
+        return codes[order], totals[order]
+
+    def top(self, year_min, year_max, num_names=10, dpt=None):
+        """Codes and births of the num_names most given names, most common first."""
+        dpt_code = None if dpt is None else self.cube.dpt_code(dpt)
+        if dpt_code is not None and dpt_code < 0:
+            return np.arange(0), np.arange(0)
+        lo, hi = self.cube.year_span(year_min, year_max)
+        if lo >= hi:
+            return np.arange(0), np.arange(0)
+
+        if num_names <= self.list_size:
+            scope = 0 if dpt_code is None else dpt_code + 1
+            years, blocks = self._components(lo, hi)
+            candidates = np.concatenate([self.year_names[scope, years].ravel(), self.block_names[scope, blocks].ravel()])
+            candidates = np.unique(candidates[candidates >= 0])
+            bound = self.year_bound[scope, years].sum() + self.block_bound[scope, blocks].sum()
+            codes, totals = self._best(candidates, self._exact_totals(candidates, year_min, year_max, dpt_code), num_names)
+            if bound == 0 or (len(codes) == num_names and totals[-1] > bound):
+                return codes, totals
+
+        codes = self._all_codes(dpt_code)
+        return self._best(codes, self._exact_totals(codes, year_min, year_max, dpt_code), num_names)
+
+    def top_names(self, year_min, year_max, num_names=10, dpt=None):
+        """Most given names between year_min and year_max, in France or in the department dpt."""
+        codes, _ = self.top(year_min, year_max, num_names, dpt)
+        return self.cube.names[codes].tolist()
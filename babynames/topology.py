@@ -0,0 +1,162 @@
+# Minimal TopoJSON encoder for the department polygons.
+#
+# Rings are cut into arcs at the junctions (points where the neighbouring
+# departments change) and every border shared by two departments is stored
+# once. Arcs are simplified one by one with Douglas-Peucker, so neighbours
+# keep exactly the same simplified border, then quantized and delta-encoded.
+import numpy as np
+
+
+def _rings(geometry):
+    polygons = geometry['coordinates'] if geometry['type'] == 'MultiPolygon' else [geometry['coordinates']]
+    return [[[tuple(point) for point in ring] for ring in polygon] for polygon in polygons]
+
+
+def _clean(ring):
+    # drop consecutive duplicates and the closing point
+    points = [ring[0]]
+    for point in ring[1:]:
+        if point != points[-1]:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    return points
+
+
+def _junctions(rings):
+    neighbours = {}
+    junctions = set()
+    for ring in rings:
+        n = len(ring)
+        for i, point in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % n]))
+            seen = neighbours.setdefault(point, pair)
+            if seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _cut(ring, junctions):
+    """Split a closed ring (without closing point) into arcs ending on junctions."""
+    cuts = [i for i, point in enumerate(ring) if point in junctions]
+    if not cuts:
+        # isolated ring: start from the smallest point so that a ring shared
+        # by two departments (an enclave) is recognised as the same arc
+        start = min(range(len(ring)), key=ring.__getitem__)
+        ring = ring[start:] + ring[:start]
+        return [ring + [ring[0]]]
+    ring = ring[cuts[0]:] + ring[:cuts[0]]
+    cuts = [c - cuts[0] for c in cuts] + [len(ring)]
+    ring = ring + [ring[0]]
+    return [ring[cuts[k]:cuts[k + 1] + 1] for k in range(len(cuts) - 1)]
+
+
+def _simplify(arc, tolerance):
+    if tolerance <= 0 or len(arc) <= 2:
+        return arc
+    # only needed to rebuild the files (python -m babynames.geo), not by the apps
+    from shapely.geometry import LineString
+    simplified = list(LineString(arc).simplify(tolerance, preserve_topology=False).coords)
+    if arc[0] == arc[-1] and len(simplified) < 4:
+        # keep isolated rings (small islands) as a triangle rather than a line
+        step = max(1, (len(arc) - 1) // 3)
+        simplified = [arc[0], arc[step], arc[2 * step], arc[0]]
+    return simplified
+
+
+def encode(features, object_name, tolerance=0.0, quantization=100000, id_property=None):
+    """Build a TopoJSON topology from GeoJSON features with (Multi)Polygon geometries."""
+    shapes = []
+    all_rings = []
+    for feature in features:
+        polygons = [[_clean(ring) for ring in polygon] for polygon in _rings(feature['geometry'])]
+        polygons = [[ring for ring in polygon if len(ring) >= 3] for polygon in polygons]
+        polygons = [polygon for polygon in polygons if polygon]
+        shapes.append(polygons)
+        all_rings.extend(ring for polygon in polygons for ring in polygon)
+
+    junctions = _junctions(all_rings)
+    points = np.array([point for ring in all_rings for point in ring])
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    kx = (x1 - x0) / (quantization - 1) or 1
+    ky = (y1 - y0) / (quantization - 1) or 1
+
+    arcs = []
+    arc_index = {}
+
+    def arc_ref(arc):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reverse = key[::-1]
+        if reverse in arc_index:
+            return ~arc_index[reverse]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return arc_index[key]
+
+    encoded_shapes = [[[[arc_ref(arc) for arc in _cut(ring, junctions)] for ring in polygon] for polygon in polygons]
+                      for polygons in shapes]
+
+    quantized_arcs = []
+    for arc in arcs:
+        q = np.rint((np.array(_simplify(arc, tolerance)) - (x0, y0)) / (kx, ky)).astype(np.int64)
+        keep = np.ones(len(q), dtype=bool)
+        keep[1:] = (q[1:] != q[:-1]).any(axis=1)
+        q = q[keep]
+        if len(q) == 1:
+            q = np.vstack([q, q])
+        deltas = np.diff(q, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+        quantized_arcs.append(deltas.tolist())
+
+    topology = {
+        'type': 'Topology',
+        'bbox': [float(x0), float(y0), float(x1), float(y1)],
+        'transform': {'scale': [float(kx), float(ky)], 'translate': [float(x0), float(y0)]},
+        'arcs': quantized_arcs,
+    }
+
+    geometries = []
+    for feature, polygons, encoded in zip(features, shapes, encoded_shapes):
+        kept = []
+        for polygon, refs in zip(polygons, encoded):
+            # rings squashed by the simplification, or turned inside out, would
+            # be drawn as covering the whole sphere: small islands and holes go
+            rings = [r for ring, r in zip(polygon, refs) if _same_winding(ring, decode_ring(topology, r))]
+            if rings and rings[0] == refs[0]:
+                kept.append(rings)
+        geometry = {'properties': feature['properties']}
+        if id_property:
+            geometry['id'] = feature['properties'][id_property]
+        if len(kept) == 1:
+            geometry.update(type='Polygon', arcs=kept[0])
+        else:
+            geometry.update(type='MultiPolygon', arcs=kept)
+        geometries.append(geometry)
+
+    topology['objects'] = {object_name: {'type': 'GeometryCollection', 'geometries': geometries}}
+    return topology
+
+
+def ring_area(ring):
+    """Signed area of a ring given as a list of points (shoelace formula)."""
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:] + ring[:1])) / 2
+
+
+def _same_winding(original, simplified):
+    area = ring_area(simplified)
+    return area != 0 and (area > 0) == (ring_area(original) > 0)
+
+
+def decode_ring(topology, arc_refs):
+    """Absolute coordinates of a ring given by arc references, used to check the output."""
+    kx, ky = topology['transform']['scale']
+    tx, ty = topology['transform']['translate']
+    ring = []
+    for ref in arc_refs:
+        arc = np.cumsum(np.array(topology['arcs'][~ref if ref < 0 else ref]), axis=0) * (kx, ky) + (tx, ty)
+        if ref < 0:
+            arc = arc[::-1]
+        ring.extend(map(tuple, arc[1:] if ring else arc))
+    return ring
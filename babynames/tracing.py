@@ -0,0 +1,170 @@
+# Lightweight tracing of the stages of the apps' requests: duration, rows,
+# payload bytes and cache hits.
+#
+# The code of a stage runs in a span:
+#     with tracing.span('map.aggregate') as span:
+#         ...
+#         span.rows = len(counts)
+# Spans nest per thread, the spans opened while another one is open are its
+# children; a finished top-level span is kept as the trace of one request.
+# The memoized functions (babynames.memo) mark the innermost open span as a
+# cache hit or miss; the bytes of the specs and of the datasets stored by the
+# datastore count in every open span, a dataset once per span however many
+# times the chart references it, so that the span of a request holds its
+# whole payload. Every stage keeps its last WINDOW samples, summary() gives
+# their rolling percentiles, shown by babynames.diagnostics as a pane and
+# served as plain text. A span costs two perf_counter calls and a deque
+# append, BABYNAMES_TRACING=0 turns the recording off.
+import collections
+import contextlib
+import os
+import threading
+import time
+
+import numpy as np
+
+ENABLED = os.environ.get('BABYNAMES_TRACING', '1') != '0'
+WINDOW = int(os.environ.get('BABYNAMES_TRACING_WINDOW', 1000))
+TRACES = 20
+QUANTILES = [50, 95, 99]
+
+
+class Span:
+    """One run of a stage, rows, bytes and cache_hit stay None when they do not apply."""
+
+    __slots__ = ('name', 'start', 'seconds', 'rows', 'bytes', 'cache_hit', 'children', 'datasets')
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.rows = None
+        self.bytes = None
+        self.cache_hit = None
+        self.children = []
+        # keys of the datasets already counted in bytes
+        self.datasets = set()
+
+    def add_bytes(self, size, key=None):
+        if key is not None:
+            if key in self.datasets:
+                return
+            self.datasets.add(key)
+        self.bytes = (self.bytes or 0) + size
+
+    def flatten(self, depth=0):
+        """(depth, span) of the span and its descendants, depth first."""
+        yield depth, self
+        for child in self.children:
+            yield from child.flatten(depth + 1)
+
+
+class Tracer:
+    """Thread-safe rolling samples of the spans of every stage, and the last traces."""
+
+    def __init__(self, window=WINDOW, traces=TRACES, enabled=ENABLED):
+        self.window = window
+        self.enabled = enabled
+        self._samples = {}
+        self._counts = collections.Counter()
+        self._traces = collections.deque(maxlen=traces)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        """Innermost open span of the calling thread, None outside any span."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextlib.contextmanager
+    def span(self, name):
+        span = Span(name)
+        if not self.enabled:
+            yield span
+            return
+        stack = self._stack()
+        if stack:
+            stack[-1].children.append(span)
+        stack.append(span)
+        try:
+            yield span
+        finally:
+            span.seconds = time.perf_counter() - span.start
+            stack.pop()
+            self.record(span, trace=not stack)
+
+    def record(self, span, trace=False):
+        with self._lock:
+            samples = self._samples.get(span.name)
+            if samples is None:
+                samples = self._samples[span.name] = collections.deque(maxlen=self.window)
+            samples.append((span.seconds, span.rows, span.bytes, span.cache_hit))
+            self._counts[span.name] += 1
+            if trace:
+                self._traces.append(span)
+
+    def add(self, name, seconds, rows=None, size=None, cache_hit=None):
+        """Record a stage timed elsewhere, e.g. the wait of a task in a queue."""
+        if not self.enabled:
+            return
+        span = Span(name)
+        span.seconds, span.rows, span.bytes, span.cache_hit = seconds, rows, size, cache_hit
+        self.record(span)
+
+    def summary(self):
+        """Per stage: total count and, over the window, percentiles in ms, mean rows and bytes, cache hit rate."""
+        with self._lock:
+            samples = {name: list(values) for name, values in self._samples.items()}
+            counts = dict(self._counts)
+        stages = []
+        for name in sorted(samples):
+            seconds, rows, sizes, hits = zip(*samples[name])
+            rows = [value for value in rows if value is not None]
+            sizes = [value for value in sizes if value is not None]
+            hits = [value for value in hits if value is not None]
+            stage = {'stage': name, 'count': counts[name], 'window': len(seconds)}
+            for quantile, value in zip(QUANTILES, np.percentile(seconds, QUANTILES)):
+                stage[f'p{quantile}_ms'] = float(value) * 1e3
+            stage['rows'] = float(np.mean(rows)) if rows else None
+            stage['bytes'] = float(np.mean(sizes)) if sizes else None
+            stage['cache_hit_rate'] = sum(hits) / len(hits) if hits else None
+            stages.append(stage)
+        return stages
+
+    def traces(self):
+        """The last finished top-level spans, the most recent last."""
+        with self._lock:
+            return list(self._traces)
+
+    def clear(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._traces.clear()
+
+
+TRACER = Tracer()
+
+
+def span(name):
+    return TRACER.span(name)
+
+
+def note_cache(hit):
+    """Mark the innermost open span of the thread as a cache hit or miss."""
+    current = TRACER.current()
+    if current is not None:
+        current.cache_hit = hit
+
+
+def note_bytes(size, key=None):
+    """Add size bytes to the payload of the open spans of the thread, once per span for a given key."""
+    if TRACER.enabled:
+        for open_span in TRACER._stack():
+            open_span.add_bytes(size, key)
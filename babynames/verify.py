@@ -0,0 +1,184 @@
+# Correctness checks of the precomputed structures against plain pandas
+# aggregations of the cleaned dataset (the way the apps originally computed
+# their results). Run from the root folder with: python -m babynames.verify
+import sys
+
+import numpy as np
+
+from babynames.cube import NameCube
+from babynames.data import CSV_PATH, load_names
+from babynames.mix import MIN_TOTAL, GenderMixIndex
+from babynames.ranking import RankingEngine
+from babynames.regions import ROLLUP_LEVELS, RegionRollups
+from babynames.similar import MIN_TOTAL as SIMILAR_MIN_TOTAL, SimilarityIndex, phonetic_key
+from babynames.topk import TopKIndex
+
+YEAR_RANGES = [(1900, 2020), (1900, 1900), (1950, 1975), (2000, 2020), (1990, 1989)]
+TOPK_RANGES = YEAR_RANGES + [(1903, 1911), (1907, 1916), (1961, 2019)]
+
+
+def sample_names(names, count=20, seed=0):
+    totals = names.groupby('preusuel', observed=True)['nombre'].sum().sort_values(ascending=False)
+    rng = np.random.default_rng(seed)
+    picked = list(totals.index[:count // 2]) + list(rng.choice(totals.index, count // 2, replace=False))
+    return picked + ['NOT_A_NAME']
+
+
+def check_cube(names, cube):
+    for name in sample_names(names):
+        for year_min, year_max in YEAR_RANGES:
+            rows = names[(names['preusuel'] == name) & (names['annais'] >= year_min) & (names['annais'] <= year_max)]
+            expected = rows.groupby('dpt', observed=True)['nombre'].sum()
+            got = cube.births_per_department(name, year_min, year_max)
+            got = dict(zip(cube.dpts[got > 0].tolist(), got[got > 0].tolist()))
+            assert got == {dpt: int(n) for dpt, n in expected.items()}, (name, year_min, year_max)
+
+            expected = rows.groupby(['annais', 'sexe'])['nombre'].sum()
+            years, got = cube.births_per_year(name, year_min, year_max)
+            for (year, sexe), n in expected.items():
+                assert got[year - years[0], sexe - 1] == n, (name, year, sexe)
+            assert got.sum() == expected.sum(), (name, year_min, year_max)
+
+        rows = names[names['preusuel'] == name]
+        expected = rows.groupby(['dpt', 'annais'], observed=True)['nombre'].sum()
+        got = cube.births_per_department_year(name)
+        assert got.sum() == expected.sum(), name
+        for (dpt, year), n in expected.items():
+            assert got[cube.dpt_code(dpt), year - cube.first_year] == n, (name, dpt, year)
+
+    for year_min, year_max in YEAR_RANGES:
+        rows = names[(names['annais'] >= year_min) & (names['annais'] <= year_max)]
+        expected = rows.groupby('preusuel', observed=True)['nombre'].sum()
+        totals = cube.name_totals(year_min, year_max)
+        got = dict(zip(cube.names[totals > 0].tolist(), totals[totals > 0].tolist()))
+        assert got == {name: int(n) for name, n in expected.items()}, (year_min, year_max)
+        # ties may be ordered differently, compare the counts of the top names
+        top = cube.top_names(year_min, year_max, 10)
+        assert [got[name] for name in top] == expected.sort_values(ascending=False).head(10).tolist()
+    print('cube: ok')
+
+
+def check_ranking(names, cube):
+    engine = RankingEngine.load(cube)
+    checked = sample_names(names, 6)
+    for year_min, year_max in YEAR_RANGES:
+        rows = names[(names['annais'] >= year_min) & (names['annais'] <= year_max)]
+        per_dpt = rows.groupby(['dpt', 'preusuel'], observed=True)['nombre'].sum().reset_index().astype({'dpt': str, 'preusuel': str})
+        births = per_dpt.groupby('dpt', observed=True)['nombre']
+        per_dpt['competition'] = births.rank(method='min', ascending=False).astype(int)
+        per_dpt['dense'] = births.rank(method='dense', ascending=False).astype(int)
+        for method in ['competition', 'dense']:
+            ranks = engine.rank(year_min, year_max, method)
+            got = ranks.ranks_of(checked)
+            for i, name in enumerate(checked):
+                expected = dict.fromkeys(cube.dpts.tolist(), -1)
+                expected.update(per_dpt[per_dpt['preusuel'] == name].set_index('dpt')[method].to_dict())
+                assert dict(zip(cube.dpts.tolist(), got[i].tolist())) == expected, (name, method, year_min, year_max)
+        top = engine.rank(year_min, year_max).top(3)
+        for dpt, dpt_names in top.items():
+            expected = per_dpt[per_dpt['dpt'] == dpt].sort_values('nombre', ascending=False)['nombre'].head(3).tolist()
+            found = per_dpt[per_dpt['dpt'] == dpt].set_index('preusuel')['nombre']
+            assert [found[name] for name in dpt_names] == expected, (dpt, year_min, year_max)
+    print('ranking: ok')
+
+
+def check_rollups(names, cube):
+    rollups = RegionRollups.load(cube)
+    checked = sample_names(names, 6)
+    for level in ROLLUP_LEVELS:
+        units = rollups.units[level].tolist()
+        unit_of = dict(zip(cube.dpts.tolist(), rollups.department_units(level)))
+        level_names = names.assign(unit=names['dpt'].astype(str).map(unit_of)).dropna(subset=['unit'])
+        for year_min, year_max in YEAR_RANGES:
+            rows = level_names[(level_names['annais'] >= year_min) & (level_names['annais'] <= year_max)]
+            per_unit = rows.groupby(['unit', 'preusuel'], observed=True)['nombre'].sum().reset_index().astype({'preusuel': str})
+            per_unit['rank'] = per_unit.groupby('unit')['nombre'].rank(method='min', ascending=False).astype(int)
+            ranks = rollups.rank(year_min, year_max, level)
+            got = ranks.ranks_of(checked)
+            for i, name in enumerate(checked):
+                found = per_unit[per_unit['preusuel'] == name].set_index('unit')
+                expected = dict.fromkeys(units, 0)
+                expected.update(found['nombre'].to_dict())
+                births = rollups.births_per_unit(name, year_min, year_max, level)
+                assert dict(zip(units, births.tolist())) == expected, (level, name, year_min, year_max)
+                expected = dict.fromkeys(units, -1)
+                expected.update(found['rank'].to_dict())
+                assert dict(zip(units, got[i].tolist())) == expected, (level, name, year_min, year_max)
+            for unit, unit_names in ranks.top(3).items():
+                found = per_unit[per_unit['unit'] == unit].set_index('preusuel')['nombre']
+                assert [found[name] for name in unit_names] == found.sort_values(ascending=False).head(3).tolist()
+
+        for name in checked:
+            expected = level_names[level_names['preusuel'] == name].groupby(['unit', 'annais'])['nombre'].sum()
+            got = rollups.births_per_unit_year(name, level)
+            assert got.sum() == expected.sum(), (level, name)
+            for (unit, year), n in expected.items():
+                assert got[units.index(unit), year - cube.first_year] == n, (level, name, unit, year)
+    print('rollups: ok')
+
+
+def check_topk(names, cube):
+    index = TopKIndex.load(cube)
+    dpts = [None] + cube.dpts[:: max(1, len(cube.dpts) // 5)].tolist()
+    for year_min, year_max in TOPK_RANGES:
+        rows = names[(names['annais'] >= year_min) & (names['annais'] <= year_max)]
+        for dpt in dpts:
+            scoped = rows if dpt is None else rows[rows['dpt'] == dpt]
+            expected = scoped.groupby('preusuel', observed=True)['nombre'].sum().sort_values(ascending=False)
+            for num_names in [1, 10, index.list_size + 10]:
+                codes, totals = index.top(year_min, year_max, num_names, dpt)
+                # ties may be ordered differently, compare the counts and check the names agree with them
+                assert totals.tolist() == expected.head(num_names).tolist(), (year_min, year_max, dpt, num_names)
+                assert all(expected[name] == n for name, n in zip(cube.names[codes].tolist(), totals.tolist()))
+    print('topk: ok')
+
+
+def check_mix(names, cube):
+    index = GenderMixIndex.load(cube)
+    for year_min, year_max in YEAR_RANGES:
+        rows = names[(names['annais'] >= year_min) & (names['annais'] <= year_max)]
+        stats = rows.groupby(['preusuel', 'sexe'], observed=True)['nombre'].sum().unstack(fill_value=0)
+        stats = stats.reindex(columns=[1, 2], fill_value=0).astype(np.int64)
+        stats = stats[stats.sum(axis=1) >= MIN_TOTAL]
+        expected = (stats[1] - stats[2]).abs().sort_values()
+        got = index.most_mixed(year_min, year_max, 20)
+        # ties may be ordered differently, compare the differences
+        assert [expected[name] for name in got] == expected.head(20).tolist(), (year_min, year_max)
+        for name in sample_names(names, 6)[:-1]:
+            if name in stats.index:
+                male, female, _, _ = index.balance(name, year_min, year_max)
+                assert (male, female) == (stats.loc[name, 1], stats.loc[name, 2]), (name, year_min, year_max)
+    print('mix: ok')
+
+
+def check_similar(names, cube):
+    index = SimilarityIndex.load(cube)
+    per_year = names.groupby(['preusuel', 'annais'], observed=True)['nombre'].sum().unstack(fill_value=0)
+    per_year = per_year.reindex(columns=cube.years, fill_value=0).astype(np.float64)
+    shares = per_year / per_year.sum(axis=0)
+    shares = shares[per_year.sum(axis=1) >= SIMILAR_MIN_TOTAL]
+    for name in sample_names(names, 6)[:-1]:
+        if name not in shares.index:
+            continue
+        expected = shares.drop(index=name).T.corrwith(shares.loc[name]).sort_values(ascending=False)
+        for approximate in [False, True]:
+            got, scores = index.similar(name, 10, approximate=approximate)
+            # float32 curves: compare the correlations, not the order of near ties
+            assert np.allclose(scores, expected.head(10).to_numpy(), atol=1e-4), (name, approximate)
+            assert np.allclose(scores, expected[got].to_numpy(), atol=1e-4), (name, approximate)
+        key = phonetic_key(name)
+        expected = sorted(other for other in cube.names.tolist() if other != name and phonetic_key(other) == key)
+        assert sorted(index.variants(name)) == expected, name
+    print('similar: ok')
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else CSV_PATH
+    names = load_names(path)
+    cube = NameCube.load(path)
+    check_cube(names, cube)
+    check_ranking(names, cube)
+    check_rollups(names, cube)
+    check_topk(names, cube)
+    check_mix(names, cube)
+    check_similar(names, cube)
@@ -0,0 +1,10 @@
+# Setup script of the panel servers: loads the shared data once, before the
+# first session is opened. panel serve app.py --setup ../babynames/warm.py
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from babynames import shared
+
+for name, seconds in shared.warm().items():
+    print(f'babynames: {name} loaded in {seconds:.2f} s')
@@ -0,0 +1 @@
+# Performance measurements of the babynames queries
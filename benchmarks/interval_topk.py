@@ -0,0 +1,56 @@
+# Compares the interval top-K index with the pandas groupby path it replaced
+# in Visualisation2 (get_most_common_names) across interval widths.
+# Run from the root folder with: python -m benchmarks.interval_topk [path/to/dpt2020.csv]
+import sys
+import time
+
+import numpy as np
+
+from babynames.cube import NameCube
+from babynames.data import CSV_PATH, load_names
+from babynames.topk import TopKIndex
+
+WIDTHS = [1, 2, 5, 10, 20, 40, 80, 121]
+REPEATS = 5
+NUM_NAMES = 10
+
+
+def groupby_top_names(names, year_min, year_max, num_names, dpt=None):
+    subset = names[(names['annais'] >= year_min) & (names['annais'] <= year_max)]
+    if dpt is not None:
+        subset = subset[subset['dpt'] == dpt]
+    subset = subset.groupby(['preusuel'], as_index=False, observed=True)['nombre'].sum()
+    subset = subset.sort_values(by='nombre', ascending=False)
+    return subset['preusuel'].head(num_names).tolist()
+
+
+def median_time(function, *args):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def main(csv_path=CSV_PATH):
+    start = time.perf_counter()
+    names = load_names(csv_path)
+    cube = NameCube.load(csv_path)
+    index = TopKIndex.load(cube, csv_path)
+    print(f'loaded data, cube and index in {time.perf_counter() - start:.3f} s ({len(names)} rows)')
+
+    rng = np.random.default_rng(0)
+    dpt = cube.dpts[len(cube.dpts) // 2]
+    print(f'{"scope":>8} {"width":>6} {"groupby ms":>11} {"index ms":>9} {"speedup":>8}')
+    for scope in [None, dpt]:
+        for width in WIDTHS:
+            year_min = int(rng.integers(cube.first_year, cube.last_year - width + 2))
+            year_max = year_min + width - 1
+            slow = median_time(groupby_top_names, names, year_min, year_max, NUM_NAMES, scope)
+            fast = median_time(index.top_names, year_min, year_max, NUM_NAMES, scope)
+            print(f'{scope or "France":>8} {width:>6} {slow * 1e3:>11.2f} {fast * 1e3:>9.3f} {slow / fast:>7.0f}x')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else CSV_PATH)
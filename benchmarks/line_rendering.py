@@ -0,0 +1,95 @@
+# Drawing and hovering many name curves in visu1, off screen (Agg): one Line2D
+# per name hit-tested one by one with line.contains (former code) against one
+# LineCollection with the hovered curve found by a CurveIndex (many names
+# mode), for the most given names.
+# Run from the root folder with: python -m benchmarks.line_rendering
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+from matplotlib.backend_bases import MouseEvent
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from babynames.cube import NameCube
+from babynames.curves import CurveIndex
+
+CURVE_COUNTS = [50, 200, 500]
+HOVERS = 200
+HOVER_PIXELS = 4
+
+
+def figure():
+    fig = Figure(figsize=(10, 6), dpi=100)
+    return fig, fig.add_subplot(111), FigureCanvasAgg(fig)
+
+
+def pointer_events(canvas, ax, cube, values, rng):
+    # half of them on a curve, half anywhere in the axes
+    events = []
+    for i in range(HOVERS):
+        year = int(rng.integers(len(cube.years)))
+        y = values[rng.integers(len(values)), year] if i % 2 else rng.uniform(0, values.max())
+        x, y = ax.transData.transform((cube.years[year], y))
+        events.append(MouseEvent('motion_notify_event', canvas, x, y))
+    return events
+
+
+def timed(function, repeats=1):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def lines_mode(cube, values, rng):
+    fig, ax, canvas = figure()
+    lines = [ax.plot(cube.years, row, picker=5)[0] for row in values]
+    ax.legend(range(len(lines)))
+    draw = timed(canvas.draw)
+    events = pointer_events(canvas, ax, cube, values, rng)
+
+    def hover():
+        for event in events:
+            for line in lines:
+                if line.contains(event)[0]:
+                    break
+    return draw, timed(hover) / len(events)
+
+
+def collection_mode(cube, values, rng):
+    fig, ax, canvas = figure()
+    segments = np.empty(values.shape + (2,))
+    segments[:, :, 0] = cube.years
+    segments[:, :, 1] = values
+    ax.add_collection(LineCollection(segments, linewidths=1))
+    ax.update_datalim([(cube.years[0], 0), (cube.years[-1], values.max())])
+    ax.autoscale_view()
+    draw = timed(canvas.draw)
+    index = CurveIndex(cube.years, values)
+    events = pointer_events(canvas, ax, cube, values, rng)
+
+    def hover():
+        for event in events:
+            (_, bottom), (_, top) = ax.transData.inverted().transform([(0, 0), (0, HOVER_PIXELS)])
+            index.nearest(event.xdata, event.ydata, abs(top - bottom))
+    return draw, timed(hover) / len(events)
+
+
+def main():
+    cube = NameCube.load()
+    births = cube.name_year_matrix()
+    order = np.argsort(-births.sum(axis=1, dtype=np.int64), kind='stable')
+    print(f'{"curves":>7} {"lines draw ms":>14} {"hover ms":>9} {"collection draw ms":>19} {"hover ms":>9}')
+    for count in CURVE_COUNTS:
+        values = births[order[:count]]
+        line_draw, line_hover = lines_mode(cube, values, np.random.default_rng(0))
+        collection_draw, collection_hover = collection_mode(cube, values, np.random.default_rng(0))
+        print(f'{count:>7} {line_draw * 1e3:>14.1f} {line_hover * 1e3:>9.3f} '
+              f'{collection_draw * 1e3:>19.1f} {collection_hover * 1e3:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+# Size and build time of the Visualisation2 map spec: polygons embedded in
+# the three layers (former code) against the geometry url + lookup of a
+# code -> count table (current code). Only the server side can be timed
+# here; the browser render time depends on the machine and is not measured.
+# Run from the root folder with: python -m benchmarks.map_payload
+import json
+import os
+import time
+
+import altair as alt
+
+from babynames import queries, shared
+from babynames.datastore import DATASTORE_ROUTE, STORE
+from babynames.geo import SIMPLIFIED_SOURCE_PATH, ensure_topology
+
+NAMES = ['MARIE', 'CAMILLE', 'PASCAL']
+REPEATS = 5
+
+
+def embedded_spec(departments, name, min_year, max_year):
+    # the three layers of the former plot_name_all_years, each with the GeoJSON features of the departments with births
+    cube = shared.cube()
+    births = dict(zip(cube.dpts.tolist(), cube.births_per_department(name, min_year, max_year).tolist()))
+    features = [{**feature, 'properties': {**feature['properties'], 'nombre': births[feature['properties']['code']]}}
+                for feature in departments if births.get(feature['properties']['code'], 0) > 0]
+    chart = alt.Chart(alt.Data(values=features)).mark_geoshape(stroke='black').encode(
+        color=alt.Color('properties.nombre:Q')).project('mercator')
+    shadow_bar = alt.Chart(alt.Data(values=features)).mark_bar().encode(y='sum(properties.nombre):Q')
+    selected_bar = alt.Chart(alt.Data(values=features)).mark_bar().encode(y='sum(properties.nombre):Q')
+    return chart | (shadow_bar + selected_bar)
+
+
+def stored_bytes(spec):
+    # datasets moved to the datastore are downloaded too, count them
+    if isinstance(spec, dict):
+        url = spec.get('url')
+        if isinstance(url, str) and url.startswith(DATASTORE_ROUTE + '/'):
+            return len(STORE.get(url[len(DATASTORE_ROUTE) + 1:-len('.json')]))
+        return sum(stored_bytes(value) for value in spec.values())
+    if isinstance(spec, list):
+        return sum(stored_bytes(value) for value in spec)
+    return 0
+
+
+def measure(build):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        spec = build().to_dict()
+        payload = json.dumps(spec)
+        times.append(time.perf_counter() - start)
+    return len(payload) + stored_bytes(spec), sorted(times)[len(times) // 2]
+
+
+def main():
+    alt.data_transformers.enable('datastore')
+    with open(SIMPLIFIED_SOURCE_PATH) as f:
+        departments = json.load(f)['features']
+    geometry_bytes = os.path.getsize(ensure_topology(queries.GEOMETRY_LEVEL))
+    print(f'source geojson {os.path.getsize(SIMPLIFIED_SOURCE_PATH)} bytes, served topojson {geometry_bytes} bytes (downloaded once)')
+    print(f'{"name":>10} {"embedded bytes":>15} {"ms":>7} {"lookup bytes":>13} {"ms":>7}')
+    for name in NAMES:
+        old_bytes, old_time = measure(lambda: embedded_spec(departments, name, 1900, 2020))
+        new_bytes, new_time = measure(lambda: queries.plot_name_all_years(name, 1900, 2020)[0])
+        print(f'{name:>10} {old_bytes:>15} {old_time * 1e3:>7.1f} {new_bytes:>13} {new_time * 1e3:>7.1f}')
+
+
+if __name__ == '__main__':
+    main()
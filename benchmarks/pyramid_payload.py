@@ -0,0 +1,62 @@
+# Size and build time of the Visualisation3 pyramid dataset as the name list
+# grows: one record per (name, sex, year) built with the former filter +
+# Cartesian product + merge + groupby + JSON round trip, against one row per
+# name with a column array per sex read from the cube (current code, unpacked
+# in the browser by flatten/fold transforms).
+# Run from the root folder with: python -m benchmarks.pyramid_payload
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from babynames.cube import NameCube
+from babynames.data import load_names
+
+NAME_COUNTS = [5, 20, 50, 100]
+MIN_YEAR, MAX_YEAR = 1900, 2020
+REPEATS = 5
+
+
+def records_payload(names, picked):
+    filtered_names = names[(names['preusuel'].isin(picked)) &
+                           (names['annais'] >= MIN_YEAR) & (names['annais'] <= MAX_YEAR)]
+    all_names = pd.DataFrame([(name, sexe, year) for name in picked
+                              for sexe in [1, 2]
+                              for year in range(MIN_YEAR, MAX_YEAR + 1)],
+                             columns=['preusuel', 'sexe', 'annais'])
+    grouped_data = pd.merge(all_names, filtered_names, on=['preusuel', 'sexe', 'annais'], how='left').fillna({'nombre': 0})
+    grouped_data = grouped_data.groupby(['preusuel', 'sexe', 'annais'], as_index=False)['nombre'].sum()
+    return json.dumps(json.loads(grouped_data.to_json(orient='records')))
+
+
+def column_payload(cube, picked):
+    births = cube.births_per_name_year(picked, MIN_YEAR, MAX_YEAR)
+    return json.dumps([{'preusuel': name, 'm': counts[:, 0].tolist(), 'f': counts[:, 1].tolist()}
+                       for name, counts in zip(picked, births)], separators=(',', ':'))
+
+
+def measure(build):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        payload = build()
+        times.append(time.perf_counter() - start)
+    return len(payload), sorted(times)[len(times) // 2]
+
+
+def main():
+    names = load_names()
+    cube = NameCube.load()
+    totals = cube.name_totals(MIN_YEAR, MAX_YEAR)
+    popular = cube.names[np.argsort(-totals, kind='stable')].tolist()
+    print(f'{"names":>6} {"records bytes":>14} {"ms":>7} {"columns bytes":>14} {"ms":>7}')
+    for count in NAME_COUNTS:
+        picked = popular[:count]
+        old_bytes, old_time = measure(lambda: records_payload(names, picked))
+        new_bytes, new_time = measure(lambda: column_payload(cube, picked))
+        print(f'{count:>6} {old_bytes:>14} {old_time * 1e3:>7.1f} {new_bytes:>14} {new_time * 1e3:>7.2f}')
+
+
+if __name__ == '__main__':
+    main()
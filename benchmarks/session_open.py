@@ -0,0 +1,44 @@
+# Time taken by a panel session to open: panel serve runs the app script
+# again for each browser session, which is what this does, SESSIONS times in
+# one process. The first session pays for the shared data unless the server
+# was warmed by the setup script (babynames/warm.py); the following ones
+# should only build their widgets. Resident memory is read from /proc, so the
+# memory column is only filled on Linux.
+# Run from the root folder with: python -m benchmarks.session_open
+import os
+import runpy
+import sys
+import time
+
+from babynames.data import ROOT
+from babynames.memory import resident_bytes
+
+APPS = ['Visualisation2', 'Visualisation3']
+SESSIONS = 5
+
+
+def open_sessions(folder, count=SESSIONS):
+    """(seconds, resident bytes afterwards) of count successive runs of the app script."""
+    cwd = os.getcwd()
+    os.chdir(os.path.join(ROOT, folder))
+    results = []
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            runpy.run_path('app.py')
+            results.append((time.perf_counter() - start, resident_bytes()))
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def main():
+    folders = sys.argv[1:] or APPS
+    for folder in folders:
+        print(folder)
+        for i, (seconds, rss) in enumerate(open_sessions(folder)):
+            print(f'  session {i + 1}: {seconds * 1e3:8.1f} ms, resident {rss / 2 ** 20:7.1f} MB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+# Latency, peak memory and Vega payload of the entry points of the apps at
+# several data scales, saved as JSON to follow them from commit to commit.
+#
+# Each scale runs in its own process on a synthetic file shaped like
+# dpt2020.csv (babynames.synthetic, generated on the first run, its cache built
+# on the first load), selected with BABYNAMES_CSV. For every entry point the
+# median latency of uncached calls over a few names and year ranges is
+# recorded, the peak of the memory allocated during a call (tracemalloc, in a
+# separate pass since tracing slows the calls down) and for the charts the
+# bytes the browser downloads: the spec and the datasets it references.
+# Results are written to .cache/benchmarks/<commit>.json; --compare prints the
+# ratios to an earlier result file.
+# Run from the root folder with: python -m benchmarks.suite --scales 1 10 [--compare .cache/benchmarks/<commit>.json]
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import matplotlib
+matplotlib.use('Agg')
+import altair as alt
+import numpy as np
+from matplotlib.collections import LineCollection
+
+from babynames import datastore  # registers the 'datastore' data transformer
+from babynames import queries, shared
+from babynames.curves import CurveIndex
+from babynames.data import CACHE_DIR, ROOT, peak_rss
+from babynames.search import NameSearchIndex
+from babynames.synthetic import ensure_synthetic
+from benchmarks.line_rendering import figure
+from benchmarks.map_payload import stored_bytes
+
+RESULTS_DIR = os.path.join(CACHE_DIR, 'benchmarks')
+SCALES = [1, 10, 100]
+REPEATS = 5
+# ratio to the compared run above which an entry is flagged
+REGRESSION_RATIO = 1.2
+SEARCHES = ['', 'M', 'MA', 'MAR', 'LÉ', 'ZZ']
+CURVES = 100
+
+
+def median_seconds(function, cases):
+    times = []
+    for case in cases:
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            function(*case)
+            times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def peak_bytes(function, cases):
+    peak = 0
+    for case in cases:
+        tracemalloc.start()
+        function(*case)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+
+def payload_bytes(chart):
+    spec = chart.to_dict()
+    return len(json.dumps(spec)) + stored_bytes(spec)
+
+
+def entry_points():
+    """name -> (function, argument tuples, True if it returns a chart)."""
+    cube = shared.cube()
+    totals = cube.name_totals(cube.first_year, cube.last_year)
+    order = np.argsort(-totals, kind='stable')
+    # the most given name, one of the first hundredth and a median one
+    names = cube.names[order[[0, len(order) // 100, len(order) // 2]]].tolist()
+    ranges = [(cube.first_year, cube.last_year), (1950, 1999), (2000, 2000)]
+    name_cases = [(name, *years) for name, years in zip(names, ranges)]
+
+    # visu1: the listbox search and update_plot in many names mode, drawn off screen
+    search_index = NameSearchIndex(cube.names)
+    births_per_year = cube.name_year_matrix()
+    fig, ax, canvas = figure()
+    collection = LineCollection([], linewidths=1)
+    ax.add_collection(collection)
+
+    def update_plot(codes):
+        values = births_per_year[codes]
+        segments = np.empty(values.shape + (2,))
+        segments[:, :, 0] = cube.years
+        segments[:, :, 1] = values
+        collection.set_segments(segments)
+        CurveIndex(cube.years, values)
+        ax.update_datalim([(cube.years[0], 0), (cube.years[-1], values.max())])
+        ax.autoscale_view()
+        canvas.draw()
+
+    return {
+        # the memoized functions are timed without their cache
+        'get_most_common_names': (queries.get_most_common_names.__wrapped__,
+                                  [(*years, 10) for years in ranges], False),
+        'get_most_common_names_per_department': (queries.get_most_common_names_per_department.__wrapped__,
+                                                 [(*years, name) for name, *years in name_cases], False),
+        'plot_name_all_years': (lambda *case: queries.plot_name_all_years(*case)[0], name_cases, True),
+        'plot_name_years': (lambda *case: queries.plot_name_years(*case)[0], name_cases, True),
+        'plot_name_pyramid': (queries.pyramid_chart, [(','.join(names),), (queries.DEFAULT_PYRAMID_NAMES,)], True),
+        'visu1.update_listbox': (search_index.search, [(text,) for text in SEARCHES], False),
+        'visu1.update_plot': (update_plot, [(order[:CURVES],), (order[-CURVES:],)], False),
+    }
+
+
+def run_scale(scale):
+    """Measures of this process, whose BABYNAMES_CSV is the synthetic file of scale."""
+    alt.data_transformers.enable('datastore')
+
+    start = time.perf_counter()
+    for load in [shared.cube, shared.rollups, shared.top_index, shared.mix_index]:
+        load()
+    loaded = time.perf_counter() - start
+    cube = shared.cube()
+    result = {
+        'scale': scale,
+        'names': len(cube.names),
+        'rows': len(cube.keys),
+        'load_seconds': loaded,
+        'entries': {},
+    }
+    for name, (function, cases, chart) in entry_points().items():
+        function(*cases[0])
+        entry = {'ms': median_seconds(function, cases) * 1e3, 'peak_bytes': peak_bytes(function, cases)}
+        if chart:
+            entry['payload_bytes'] = max(payload_bytes(function(*case)) for case in cases)
+        result['entries'][name] = entry
+    result['peak_rss_bytes'] = peak_rss()
+    return result
+
+
+def measure_scale(scale):
+    """Generate the file of scale if needed and measure it in a new process."""
+    env = dict(os.environ, BABYNAMES_CSV=ensure_synthetic(scale))
+    with tempfile.NamedTemporaryFile(suffix='.json') as output:
+        subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--child', str(scale), output.name],
+                       cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+        return json.load(output)
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_results(results, baseline=None):
+    base = {(run['scale'], name): entry for run in (baseline or {}).get('runs', [])
+            for name, entry in run['entries'].items()}
+    for run in results['runs']:
+        print(f'scale {run["scale"]:g}: {run["names"]} names, {run["rows"]} rows, loaded in {run["load_seconds"]:.1f} s, '
+              f'peak resident {(run["peak_rss_bytes"] or 0) / 2 ** 20:.0f} MB')
+        print(f'  {"entry point":<38} {"ms":>9} {"peak KB":>9} {"payload KB":>11}' + (f' {"ms ratio":>9}' if base else ''))
+        for name, entry in run['entries'].items():
+            payload = entry.get('payload_bytes')
+            line = (f'  {name:<38} {entry["ms"]:>9.2f} {entry["peak_bytes"] / 1024:>9.0f} '
+                    f'{"" if payload is None else f"{payload / 1024:.1f}":>11}')
+            previous = base.get((run['scale'], name))
+            if previous:
+                ratio = entry['ms'] / previous['ms']
+                line += f' {ratio:>8.2f}x' + (' regression' if ratio > REGRESSION_RATIO else '')
+            print(line)
+
+
+def main():
+    if sys.argv[1:2] == ['--child']:
+        scale, output = float(sys.argv[2]), sys.argv[3]
+        with open(output, 'w') as f:
+            json.dump(run_scale(scale), f)
+        return
+    parser = argparse.ArgumentParser(description='Benchmark the entry points of the apps on synthetic data.')
+    parser.add_argument('--scales', nargs='+', type=float, default=SCALES)
+    parser.add_argument('--compare', help='result file of an earlier run')
+    parser.add_argument('--output', help=f'result file, {RESULTS_DIR}/<commit>.json by default')
+    args = parser.parse_args()
+    results = {'commit': commit(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'runs': [measure_scale(scale) for scale in args.scales]}
+    output = args.output or os.path.join(RESULTS_DIR, f'{results["commit"]}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f'saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+# Memory of several server workers, started like panel serve --num-procs
+# starts them: forked from a process which imported panel and the plugins,
+# each worker then loads the shared data (babynames.shared), opens a session
+# of the app and answers a few queries. The proportional set size (PSS,
+# shared pages split between the processes using them) is summed over the
+# parent and the workers. The memory-mapped arrays are shared through the
+# page cache and the code imported before the fork stays shared, but every
+# worker has its own Python heap (modules imported after the fork, widgets,
+# caches), so the total still grows by the private memory of one worker for
+# every worker added. Reads /proc, Linux only.
+# Run from the root folder with: python -m benchmarks.worker_memory [app folder]
+import multiprocessing
+import os
+import runpy
+import sys
+
+import panel  # noqa: F401, imported by panel serve before forking the workers
+from babynames import datastore  # noqa: F401, the plugin of --plugins babynames.datastore
+from babynames.data import ROOT
+
+WORKER_COUNTS = [1, 2, 4]
+QUERIES = [('MARIE', 1900, 2020), ('CAMILLE', 1950, 2000), ('PASCAL', 1960, 1980)]
+
+
+def memory_rollup():
+    """PSS, private and shared resident bytes of the current process."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    shared = fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)
+    return fields.get('Pss', 0), private, shared
+
+
+def worker(folder, ready, measure, results):
+    os.chdir(os.path.join(ROOT, folder))
+    app = runpy.run_path('app.py')
+    if 'query_plot' in app:
+        for name, year_min, year_max in QUERIES:
+            app['query_plot'](name, year_min, year_max, False)
+    ready.wait()
+    # measure once every worker has loaded, so that the shared pages are counted once
+    measure.wait()
+    results.put(memory_rollup())
+
+
+def run(folder, count):
+    context = multiprocessing.get_context('fork')
+    ready = context.Barrier(count + 1)
+    measure = context.Barrier(count + 1)
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(folder, ready, measure, results)) for _ in range(count)]
+    for process in workers:
+        process.start()
+    ready.wait()
+    measure.wait()
+    # the parent, whose pages are shared with the workers, is measured while they run
+    parent = memory_rollup()
+    rollups = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    return parent, rollups
+
+
+def main():
+    folder = sys.argv[1] if len(sys.argv) > 1 else 'Visualisation2'
+    print(f'{"workers":>8} {"total PSS MB":>13} {"private MB/worker":>18} {"shared MB/worker":>17}')
+    for count in WORKER_COUNTS:
+        parent, rollups = run(folder, count)
+        pss = parent[0] + sum(r[0] for r in rollups)
+        private = sum(r[1] for r in rollups) / count
+        shared = sum(r[2] for r in rollups) / count
+        print(f'{count:>8} {pss / 2 ** 20:>13.1f} {private / 2 ** 20:>18.1f} {shared / 2 ** 20:>17.1f}')
+
+
+if __name__ == '__main__':
+    main()